@@ -0,0 +1,51 @@
+import datetime
+import sys
+
+import db_helper
+
+
+# Build the sales report of a day from the precomputed rollup
+def get_sales_report(sale_date: datetime.date, by_hour: bool = False):
+    rows = db_helper.get_sales_rollup(sale_date, by_hour)
+    if rows is None:
+        return None
+
+    if by_hour:
+        items = [
+            {
+                "hour": hour,
+                "item": name,
+                "quantity": int(quantity),
+                "revenue": float(revenue),
+                "orders": int(order_count),
+            }
+            for hour, name, quantity, revenue, order_count in rows
+        ]
+    else:
+        items = [
+            {
+                "item": name,
+                "quantity": int(quantity),
+                "revenue": float(revenue),
+                "orders": int(order_count),
+            }
+            for name, quantity, revenue, order_count in rows
+        ]
+
+    return {
+        "date": sale_date.isoformat(),
+        "total_revenue": round(sum(item["revenue"] for item in items), 2),
+        "items": items,
+    }
+
+
+if __name__ == "__main__":
+
+    # Backfill: python analytics_helper.py backfill (orders keep being placed while it runs)
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        rebuilt_rows = db_helper.rebuild_sales_rollup()
+        if rebuilt_rows == -1:
+            sys.exit(1)
+        print(f"Rebuilt sales rollup with {rebuilt_rows} rows.")
+    else:
+        print("Usage: python analytics_helper.py backfill")
@@ -0,0 +1,96 @@
+"""Simulate a busy kitchen and time the queue behind delivery estimates.
+
+    python benchmarks/bench_kitchen.py --open-orders 5000 --operations 200000
+
+Keeps the given number of orders open while new orders arrive, old ones
+leave the kitchen and customers ask for estimates. Each estimate is checked
+against a plain scan of all open orders, and the timings of both are shown.
+Prep times come from the menu snapshot, which is published from DB_* if missing.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import kitchen_helper  # noqa: E402
+import menu_helper  # noqa: E402
+
+FALLBACK_MENU = ["Pav Bhaji", "Chole Bhature", "Pizza", "Mango Lassi", "Masala Dosa",
+                 "Vegetable Biryani", "Vada Pav", "Rava Dosa", "Samosa"]
+
+
+def menu_names():
+    snapshot = menu_helper.get_snapshot()
+    if snapshot is None or snapshot.count == 0:
+        return FALLBACK_MENU
+    return [snapshot.record(position)[1] for position in range(snapshot.count)]
+
+
+MENU = menu_names()
+
+
+def random_order():
+    return {food_item: random.randint(1, 3) for food_item in random.sample(MENU, random.randint(1, 4))}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--open-orders", type=int, default=5000)
+    parser.add_argument("--operations", type=int, default=200000)
+    args = parser.parse_args()
+
+    queue = kitchen_helper.KitchenQueue()
+    naive = {}
+    next_order_id = 1
+    for _ in range(args.open_orders):
+        weight = kitchen_helper.order_weight(random_order())
+        queue.open(next_order_id, weight)
+        naive[next_order_id] = weight
+        next_order_id += 1
+
+    timings = {"open": [], "close": [], "eta": []}
+    naive_eta_seconds = 0.0
+    mismatches = 0
+
+    for _ in range(args.operations):
+        action = random.random()
+        if action < 0.25:
+            weight = kitchen_helper.order_weight(random_order())
+            start = time.perf_counter()
+            queue.open(next_order_id, weight)
+            timings["open"].append(time.perf_counter() - start)
+            naive[next_order_id] = weight
+            next_order_id += 1
+        elif action < 0.5 and naive:
+            # Mostly the oldest orders leave the kitchen first
+            order_id = min(random.sample(list(naive), min(3, len(naive))))
+            start = time.perf_counter()
+            queue.close(order_id)
+            timings["close"].append(time.perf_counter() - start)
+            del naive[order_id]
+        elif naive:
+            order_id = random.choice(list(naive))
+            start = time.perf_counter()
+            ahead = queue.weight_ahead(order_id)
+            timings["eta"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            expected = sum(weight for other_id, weight in naive.items() if other_id < order_id)
+            naive_eta_seconds += time.perf_counter() - start
+            mismatches += ahead != expected
+
+    print(f"{len(queue)} orders open at the end, {queue.total_weight} prep minutes queued")
+    for operation, samples in timings.items():
+        samples.sort()
+        if samples:
+            print(f"{operation:<6} {len(samples):>8} ops  median {samples[len(samples) // 2] * 1e6:7.2f} us  "
+                  f"p99 {samples[int(len(samples) * 0.99) - 1] * 1e6:7.2f} us")
+    if timings["eta"]:
+        print(f"scanning all open orders instead: {naive_eta_seconds / len(timings['eta']) * 1e6:.2f} us per estimate")
+    print(f"mismatches against the scan: {mismatches}")
+
+    sys.exit(1 if mismatches else 0)
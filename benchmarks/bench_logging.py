@@ -0,0 +1,81 @@
+"""Measure what logging costs the webhook request path.
+
+    python benchmarks/bench_logging.py --requests 20000
+
+A simulated request sets a correlation ID, logs three order item successes
+and one request event, like complete_order does, then waits as if on the
+database. The numbers are CPU time of the calling thread (time.thread_time),
+i.e. what logging takes away from the request; JSON formatting and writing
+happen on the writer thread, which writes to /dev/null here. For comparison
+the same events are written with print() and a synchronous JSON StreamHandler.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import log_helper  # noqa: E402
+
+
+# CPU time the calling thread spends logging, with a simulated DB wait between requests
+def per_request_us(run, requests, db_wait):
+    spent = 0.0
+    for request_number in range(requests):
+        start = time.thread_time()
+        run(request_number)
+        spent += time.thread_time() - start
+        if db_wait:
+            time.sleep(db_wait)
+    return spent / requests * 1e6
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--db-wait", type=float, default=0.0002, help="seconds of simulated DB wait per request")
+    args = parser.parse_args()
+
+    devnull = open(os.devnull, "w")
+    log_helper._listener.stop()
+    log_helper._listener = log_helper.configure(devnull)
+    logger = log_helper.get_logger("bench")
+
+    def queued(request_number):
+        log_helper.new_correlation_id()
+        for food_item in ("Samosa", "Pizza", "Mango Lassi"):
+            log_helper.log_success(logger, "Order item inserted", order_id=request_number, food_item=food_item)
+        log_helper.log_success(logger, "Webhook request handled", intent="order.complete", latency_ms=1.0)
+
+    def queued_unsampled(request_number):
+        log_helper.new_correlation_id()
+        for food_item in ("Samosa", "Pizza", "Mango Lassi"):
+            logger.info("Order item inserted", extra={"order_id": request_number, "food_item": food_item})
+        logger.info("Webhook request handled", extra={"intent": "order.complete", "latency_ms": 1.0})
+
+    def printed(request_number):
+        for food_item in ("Samosa", "Pizza", "Mango Lassi"):
+            print(f"Order item {food_item} inserted successfully!", file=devnull, flush=True)
+        print("Webhook request handled", file=devnull, flush=True)
+
+    sync_logger = logging.getLogger("bench_sync")
+    sync_handler = logging.StreamHandler(devnull)
+    sync_handler.setFormatter(log_helper.JsonFormatter())
+    sync_logger.addHandler(sync_handler)
+    sync_logger.setLevel(logging.INFO)
+    sync_logger.propagate = False
+
+    def synchronous(request_number):
+        for food_item in ("Samosa", "Pizza", "Mango Lassi"):
+            sync_logger.info("Order item inserted", extra={"order_id": request_number, "food_item": food_item})
+        sync_logger.info("Webhook request handled", extra={"intent": "order.complete", "latency_ms": 1.0})
+
+    print(f"print() with flush:                  {per_request_us(printed, args.requests, args.db_wait):8.2f} us per request")
+    print(f"synchronous JSON handler:            {per_request_us(synchronous, args.requests, args.db_wait):8.2f} us per request")
+    print(f"queued, every event:                 {per_request_us(queued_unsampled, args.requests, args.db_wait):8.2f} us per request")
+    print(f"queued, success sampled at {log_helper.LOG_SUCCESS_SAMPLE_RATE:<8}: "
+          f"{per_request_us(queued, args.requests, args.db_wait):8.2f} us per request")
+    print(f"records dropped because the queue was full: {log_helper.NonBlockingQueueHandler.dropped}")
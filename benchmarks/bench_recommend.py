@@ -0,0 +1,63 @@
+"""Measure what "frequently ordered together" suggestions add to add_to_order.
+
+    python benchmarks/bench_recommend.py --items 200 --orders 100000
+
+Builds a co-occurrence index from generated orders and a menu snapshot in a
+temporary file, then times suggest_for_cart (menu lookups plus the index) for
+carts of one to five items. Exits non-zero if p99 is not under a millisecond.
+No rows are read, but db_helper still connects on import, so DB_* must be set.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ["MENU_SNAPSHOT_PATH"] = os.path.join(tempfile.mkdtemp(), "menu.snapshot")
+
+import menu_helper  # noqa: E402
+import recommend_helper  # noqa: E402
+
+
+def percentile(ordered, fraction):
+    return ordered[max(int(len(ordered) * fraction) - 1, 0)]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    args = parser.parse_args()
+
+    names = [f"Item {item_id}" for item_id in range(1, args.items + 1)]
+    menu_helper.publish([(item_id, name, 5) for item_id, name in enumerate(names, start=1)])
+
+    # A few popular items make the counts skewed like real orders
+    weights = [1.0 / rank for rank in range(1, args.items + 1)]
+    recommend_helper.index = recommend_helper.CoOccurrenceIndex()
+    start = time.perf_counter()
+    for _ in range(args.orders):
+        recommend_helper.index.add_order(random.choices(range(1, args.items + 1), weights, k=random.randint(1, 4)))
+    build_seconds = time.perf_counter() - start
+    print(f"indexed {args.orders} orders over {args.items} items in {build_seconds:.2f}s "
+          f"({build_seconds / args.orders * 1e6:.1f} us per order)")
+
+    failed = False
+    for cart_size in range(1, 6):
+        timings = []
+        for _ in range(args.lookups):
+            cart = random.sample(names, cart_size)
+            start = time.perf_counter()
+            recommend_helper.suggest_for_cart(cart)
+            timings.append((time.perf_counter() - start) * 1e6)
+        timings.sort()
+        p99 = percentile(timings, 0.99)
+        failed = failed or p99 >= 1000
+        print(f"cart of {cart_size}: median {percentile(timings, 0.5):.1f} us, p99 {p99:.1f} us")
+
+    sys.exit(1 if failed else 0)
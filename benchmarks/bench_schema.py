@@ -0,0 +1,132 @@
+"""Time the queries the webhook runs against a large generated dataset.
+
+Run it before and after `python migration_helper.py up` to compare:
+
+    python benchmarks/bench_schema.py --seed-orders 2000000 --seed-items 5000
+    python benchmarks/bench_schema.py
+    python migration_helper.py up
+    python benchmarks/bench_schema.py
+
+Seeding writes into the database configured by the DB_* environment
+variables, so point them at a scratch copy of the schema.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_helper  # noqa: E402
+
+STATUSES = ["delivered"] * 8 + ["in transit", "in progress"]
+
+
+def seed_items(cnx, count):
+    cursor = cnx.cursor()
+    cursor.execute("SELECT COALESCE(MAX(item_id), 0) FROM food_items")
+    first_id = cursor.fetchone()[0] + 1
+    rows = [(item_id, f"Bench Item {item_id}", round(random.uniform(2, 15), 2))
+            for item_id in range(first_id, first_id + count)]
+    cursor.executemany("INSERT INTO food_items (item_id, name, price) VALUES (%s, %s, %s)", rows)
+    cnx.commit()
+    cursor.close()
+
+
+def seed_orders(cnx, count, batch_size=10000):
+    cursor = cnx.cursor()
+    cursor.execute("SELECT item_id, price FROM food_items")
+    items = cursor.fetchall()
+    cursor.execute("SELECT COALESCE(MAX(order_id), 0) FROM orders")
+    next_order_id = cursor.fetchone()[0] + 1
+
+    remaining = count
+    while remaining > 0:
+        order_rows = []
+        tracking_rows = []
+        for order_id in range(next_order_id, next_order_id + min(batch_size, remaining)):
+            for item_id, price in random.sample(items, random.randint(1, min(4, len(items)))):
+                quantity = random.randint(1, 5)
+                order_rows.append((order_id, item_id, quantity, price * quantity))
+            tracking_rows.append((order_id, random.choice(STATUSES)))
+
+        cursor.executemany(
+            "INSERT INTO orders (order_id, item_id, quantity, total_price) VALUES (%s, %s, %s, %s)",
+            order_rows
+        )
+        cursor.executemany("INSERT INTO order_tracking (order_id, status) VALUES (%s, %s)", tracking_rows)
+        cnx.commit()
+
+        seeded = len(tracking_rows)
+        next_order_id += seeded
+        remaining -= seeded
+        print(f"seeded {count - remaining}/{count} orders", file=sys.stderr)
+
+    cursor.close()
+
+
+def time_query(cnx, query, params_fn, runs):
+    cursor = cnx.cursor()
+    timings = []
+    for _ in range(runs):
+        params = params_fn()
+        start = time.perf_counter()
+        cursor.execute(query, params)
+        cursor.fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    cursor.close()
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def run_benchmarks(cnx, runs):
+    cursor = cnx.cursor()
+    cursor.execute("SELECT name FROM food_items")
+    names = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT COALESCE(MAX(order_id), 1) FROM orders")
+    max_order_id = cursor.fetchone()[0]
+    cursor.close()
+
+    def random_order():
+        return (random.randint(1, max_order_id),)
+
+    def recent_range():
+        return (max_order_id - 1000, max_order_id)
+
+    cases = [
+        ("item lookup by name", "SELECT item_id FROM food_items WHERE name = %s",
+         lambda: (random.choice(names),)),
+        ("get_price_for_item", "SELECT get_price_for_item(%s)", lambda: (random.choice(names),)),
+        ("get_total_order_price", "SELECT get_total_order_price(%s)", random_order),
+        ("order status", "SELECT status FROM order_tracking WHERE order_id = %s", random_order),
+        ("in progress count", "SELECT COUNT(*) FROM order_tracking WHERE status = 'in progress'", lambda: ()),
+        ("next order id", "SELECT MAX(order_id) FROM orders", lambda: ()),
+        ("recent order range", "SELECT SUM(total_price) FROM orders WHERE order_id BETWEEN %s AND %s",
+         recent_range),
+    ]
+
+    print(f"{'query':<24}{'median ms':>12}{'p95 ms':>12}")
+    for label, query, params_fn in cases:
+        median, p95 = time_query(cnx, query, params_fn, runs)
+        print(f"{label:<24}{median:>12.3f}{p95:>12.3f}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed-items", type=int, default=0, help="extra food items to generate")
+    parser.add_argument("--seed-orders", type=int, default=0, help="orders to generate")
+    parser.add_argument("--runs", type=int, default=200, help="executions per query")
+    args = parser.parse_args()
+
+    cnx = db_helper.connect()
+    try:
+        if args.seed_items:
+            seed_items(cnx, args.seed_items)
+        if args.seed_orders:
+            seed_orders(cnx, args.seed_orders)
+        run_benchmarks(cnx, args.runs)
+    finally:
+        cnx.close()
@@ -0,0 +1,222 @@
+"""Replay captured webhook traffic against the app and profile it per intent.
+
+    CAPTURE_SAMPLE_RATE=0.05 uvicorn main:app           # record traffic
+    python benchmarks/replay.py captures/webhook.ndjson --out profiles/
+
+The app's lifespan runs first, as it does under uvicorn: the menu snapshot is
+refreshed, the kitchen queue is loaded and the recommendation index is built
+before the first payload, so the profiles include suggestions and ETAs.
+The payloads are then sent straight into the ASGI app in this thread, so the
+database configured by the DB_* environment variables receives the orders.
+For every intent the output directory gets:
+
+    <intent>.pstats     cProfile stats (snakeviz, flameprof, pstats)
+    <intent>.folded     sampled stacks in collapsed format (flamegraph.pl, speedscope)
+    <intent>.alloc.txt  tracemalloc top allocators and peak/net memory
+    summary.txt         request counts and latency per intent
+"""
+import argparse
+import asyncio
+import cProfile
+import collections
+import json
+import os
+import re
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Replays are bursty by nature, so lift the per-session limits, and never capture the replay itself
+os.environ.setdefault("SESSION_RATE", "1000000000")
+os.environ.setdefault("SESSION_BURST", "1000000000")
+os.environ.setdefault("MAX_QUEUED_REQUESTS", "1000000000")
+os.environ["CAPTURE_SAMPLE_RATE"] = "0"
+
+import main  # noqa: E402
+import recommend_helper  # noqa: E402
+
+
+# Run handlers in this thread instead of the threadpool, so cProfile and tracemalloc see them
+async def run_handler_inline(handler, parameters, session_id):
+    return handler(parameters, session_id)
+
+
+def read_captures(paths):
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)["payload"]
+
+
+def intent_of(payload):
+    try:
+        return payload["queryResult"]["intent"]["displayName"]
+    except (KeyError, TypeError):
+        return "unknown"
+
+
+def slugify(name):
+    return re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_") or "unknown"
+
+
+# Send one payload through the ASGI app the same way uvicorn would
+async def post_payload(payload):
+    body = json.dumps(payload).encode("utf-8")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/",
+        "raw_path": b"/",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 0),
+        "server": ("replay", 80),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        return {"type": "http.disconnect"}
+
+    status = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await main.app(scope, receive, send)
+    return status[0] if status else None
+
+
+class StackSampler(threading.Thread):
+    """Samples the replay thread's stack and counts collapsed stacks per intent."""
+
+    def __init__(self, target_thread_id, interval):
+        super().__init__(daemon=True)
+        self.target_thread_id = target_thread_id
+        self.interval = interval
+        self.current_intent = None
+        self.stacks = collections.defaultdict(collections.Counter)
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            intent = self.current_intent
+            frame = sys._current_frames().get(self.target_thread_id)
+            if intent is None or frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[intent][";".join(reversed(names))] += 1
+
+
+def replay(payloads, out_dir, sample_interval, detail_every):
+    os.makedirs(out_dir, exist_ok=True)
+    loop = asyncio.new_event_loop()
+    lifespan = main.app.router.lifespan_context(main.app)
+    loop.run_until_complete(lifespan.__aenter__())
+    recommend_helper.wait_for_load()
+
+    profilers = collections.defaultdict(cProfile.Profile)
+    latencies = collections.defaultdict(list)
+    peaks = collections.defaultdict(int)
+    net_bytes = collections.defaultdict(int)
+    alloc_stats = collections.defaultdict(collections.Counter)
+    statuses = collections.defaultdict(collections.Counter)
+
+    sampler = StackSampler(threading.get_ident(), sample_interval)
+    sampler.start()
+    tracemalloc.start(10)
+
+    try:
+        for payload in payloads:
+            intent = intent_of(payload)
+            detailed = len(latencies[intent]) % detail_every == 0
+            before = tracemalloc.take_snapshot() if detailed else None
+
+            tracemalloc.reset_peak()
+            current_before = tracemalloc.get_traced_memory()[0]
+            sampler.current_intent = intent
+            profiler = profilers[intent]
+
+            start = time.perf_counter()
+            profiler.enable()
+            status = loop.run_until_complete(post_payload(payload))
+            profiler.disable()
+            latencies[intent].append((time.perf_counter() - start) * 1000)
+
+            sampler.current_intent = None
+            current_after, peak = tracemalloc.get_traced_memory()
+            peaks[intent] = max(peaks[intent], peak - current_before)
+            net_bytes[intent] += current_after - current_before
+            statuses[intent][status] += 1
+
+            if detailed:
+                after = tracemalloc.take_snapshot()
+                for stat in after.compare_to(before, "lineno"):
+                    if stat.size_diff > 0:
+                        alloc_stats[intent][str(stat.traceback[0])] += stat.size_diff
+    finally:
+        tracemalloc.stop()
+        sampler.stopped.set()
+        sampler.join()
+        loop.run_until_complete(lifespan.__aexit__(None, None, None))
+        loop.close()
+
+    summary_lines = [f"{'intent':<45}{'requests':>10}{'mean ms':>10}{'p95 ms':>10}{'peak KiB':>10}"]
+    for intent, timings in sorted(latencies.items()):
+        slug = slugify(intent)
+        profilers[intent].dump_stats(os.path.join(out_dir, f"{slug}.pstats"))
+
+        with open(os.path.join(out_dir, f"{slug}.folded"), "w") as f:
+            for stack, count in sampler.stacks[intent].most_common():
+                f.write(f"{stack} {count}\n")
+
+        with open(os.path.join(out_dir, f"{slug}.alloc.txt"), "w") as f:
+            f.write(f"intent: {intent}\n")
+            f.write(f"peak bytes above baseline per request: {peaks[intent]}\n")
+            f.write(f"net bytes retained over all requests: {net_bytes[intent]}\n")
+            f.write(f"response statuses: {dict(statuses[intent])}\n\n")
+            f.write(f"top allocators (every {detail_every}th request):\n")
+            for location, size in alloc_stats[intent].most_common(25):
+                f.write(f"{size:>12}  {location}\n")
+
+        ordered = sorted(timings)
+        p95 = ordered[max(int(len(ordered) * 0.95) - 1, 0)]
+        summary_lines.append(
+            f"{intent[:44]:<45}{len(timings):>10}{statistics.mean(timings):>10.3f}{p95:>10.3f}"
+            f"{peaks[intent] / 1024:>10.1f}"
+        )
+
+    summary = "\n".join(summary_lines) + "\n"
+    with open(os.path.join(out_dir, "summary.txt"), "w") as f:
+        f.write(summary)
+    return summary
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("captures", nargs="+", help="NDJSON capture files, replayed in the given order")
+    parser.add_argument("--out", default="profiles", help="output directory")
+    parser.add_argument("--sample-interval", type=float, default=0.001, help="stack sampling interval in seconds")
+    parser.add_argument("--detail-every", type=int, default=10,
+                        help="take tracemalloc snapshots around every Nth request of an intent")
+    args = parser.parse_args()
+
+    main.run_handler = run_handler_inline
+    print(replay(read_captures(args.captures), args.out, args.sample_interval, args.detail_every), end="")
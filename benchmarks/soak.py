@@ -0,0 +1,407 @@
+"""Soak test: drive simulated conversations through the app and fail on leaks.
+
+    python benchmarks/soak.py --conversations 1000000 --sample-every 10000
+
+Each conversation adds items, sometimes removes one, and then either
+completes the order, abandons the cart or tracks an order. Once more than
+--open-orders orders are in progress, the oldest are marked delivered the way
+the kitchen does, so the kitchen queue reaches a steady size. Every
+--endpoint-every conversations the harness also fetches the sales report,
+exports a small range of orders, and starts a full export that disconnects
+after the first chunk. Requests go straight into the ASGI app (see replay.py)
+and handlers run in the threadpool as they do under uvicorn, so completed
+orders are written to the database configured by the DB_* environment
+variables; use a scratch copy.
+
+Every --sample-every conversations the harness records RSS, tracemalloc
+memory, open cursors and connections, open file descriptors, in-progress carts
+and latency percentiles. The first --warmup fraction of samples is ignored;
+after that, any metric whose last third grows past its first third by more
+than its tolerance fails the run, and the top growing allocators are printed.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# These are read when main is imported, so they are set first. Abandoned carts have to
+# expire within the run to tell them apart from a leak; the kitchen queue reloads often
+# enough to be exercised; simulated sessions are never rate limited or captured.
+os.environ.setdefault("CART_TTL_SECONDS", "5")
+os.environ.setdefault("KITCHEN_RESYNC_SECONDS", "5")
+os.environ.setdefault("SESSION_RATE", "1000000000")
+os.environ.setdefault("SESSION_BURST", "1000000000")
+os.environ.setdefault("MAX_QUEUED_REQUESTS", "1000000000")
+os.environ["CAPTURE_SAMPLE_RATE"] = "0"
+
+import db_helper  # noqa: E402
+import kitchen_helper  # noqa: E402
+import main  # noqa: E402
+import menu_helper  # noqa: E402
+import rate_limit_helper  # noqa: E402
+from replay import post_payload  # noqa: E402
+
+FALLBACK_MENU = ["Pav Bhaji", "Chole Bhature", "Pizza", "Mango Lassi", "Masala Dosa",
+                 "Vegetable Biryani", "Vada Pav", "Rava Dosa", "Samosa"]
+
+# Allowed growth from the first to the last third of the samples: (relative, absolute).
+# A background kitchen reload can hold one connection and cursor while a sample is taken.
+TOLERANCES = {
+    "rss_kib": (0.10, 5 * 1024),
+    "traced_kib": (0.10, 2 * 1024),
+    "open_cursors": (0.0, 1),
+    "open_connections": (0.0, 1),
+    "open_fds": (0.0, 5),
+    "carts": (0.10, 100),
+    "p50_ms": (0.50, 1.0),
+    "p99_ms": (0.50, 2.0),
+}
+
+
+class Tracked:
+    """Delegates to a cursor or connection and reports when it is closed."""
+
+    def __init__(self, wrapped, on_close):
+        self._wrapped = wrapped
+        self._on_close = on_close
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+    def __iter__(self):
+        return iter(self._wrapped)
+
+    def close(self, *args, **kwargs):
+        if self._on_close is not None:
+            self._on_close()
+            self._on_close = None
+        return self._wrapped.close(*args, **kwargs)
+
+
+class TrackedConnection(Tracked):
+    def __init__(self, wrapped, on_close, counter):
+        super().__init__(wrapped, on_close)
+        self._counter = counter
+
+    def cursor(self, *args, **kwargs):
+        return self._counter.track_cursor(self._wrapped.cursor(*args, **kwargs))
+
+
+class ResourceCounter:
+    """Counts cursors and connections that were opened but not closed yet."""
+
+    def __init__(self):
+        self.cursors_opened = 0
+        self.cursors_closed = 0
+        self.connections_opened = 0
+        self.connections_closed = 0
+
+    def cursor_closed(self):
+        self.cursors_closed += 1
+
+    def connection_closed(self):
+        self.connections_closed += 1
+
+    def track_cursor(self, cursor):
+        self.cursors_opened += 1
+        return Tracked(cursor, self.cursor_closed)
+
+    def track_connection(self, cnx):
+        self.connections_opened += 1
+        return TrackedConnection(cnx, self.connection_closed, self)
+
+    def install(self):
+        # The module level connection stays open for the life of the process, so only its cursors count
+        db_helper.cnx = TrackedConnection(db_helper.cnx, None, self)
+        original_connect = db_helper.connect
+        db_helper.connect = lambda: self.track_connection(original_connect())
+
+    @property
+    def open_cursors(self):
+        return self.cursors_opened - self.cursors_closed
+
+    @property
+    def open_connections(self):
+        return self.connections_opened - self.connections_closed
+
+
+class ErrorCounter(logging.Handler):
+    """Counts errors the app logs; the webhook still answers those requests with a 200."""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+def rss_kib():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def open_fds():
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return 0
+
+
+def menu_names():
+    snapshot = menu_helper.get_snapshot()
+    if snapshot is None or snapshot.count == 0:
+        return FALLBACK_MENU
+    return [snapshot.record(position)[1] for position in range(snapshot.count)]
+
+
+def build_payload(session_id, intent, parameters):
+    return {
+        "responseId": uuid.uuid4().hex,
+        "session": f"projects/soak/agent/sessions/{session_id}",
+        "queryResult": {
+            "intent": {"displayName": intent},
+            "parameters": parameters,
+            "outputContexts": [
+                {"name": f"projects/soak/agent/sessions/{session_id}/contexts/ongoing-order"}
+            ],
+        },
+    }
+
+
+# Send a GET request through the ASGI app. With abort set, the client goes away
+# after the first body chunk, the way a dropped download does under uvicorn.
+async def get(path, query="", abort=False):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [],
+        "client": ("127.0.0.1", 0),
+        "server": ("soak", 80),
+    }
+    disconnected = asyncio.Event()
+    request_sent = False
+    status = None
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body") and abort:
+            disconnected.set()
+            raise OSError("client disconnected")
+
+    try:
+        await main.app(scope, receive, send)
+    except OSError:
+        if not abort:
+            raise
+    return status
+
+
+# Fetch a sales report, export a few recent orders, and abandon a full export
+async def hit_endpoints(endpoint_counts):
+    by = random.choice(["day", "hour"])
+    status = await get("/reports/sales", f"by={by}")
+    endpoint_counts["report" if status == 200 else "failed"] += 1
+
+    last_order_id = max(db_helper.get_next_order_id() - 1, 1)
+    start_id = max(last_order_id - random.randint(1, 50), 1)
+    status = await get("/export/orders", f"format={random.choice(['csv', 'ndjson'])}&start_id={start_id}&end_id={last_order_id}")
+    endpoint_counts["export" if status == 200 else "failed"] += 1
+
+    status = await get("/export/orders", "format=ndjson", abort=True)
+    endpoint_counts["aborted export" if status == 200 else "failed"] += 1
+
+
+# Mark the oldest orders delivered while more than max_open are in progress.
+# Returns the number delivered, or -1 if a status update failed.
+def deliver_orders(max_open):
+    delivered = 0
+    while len(kitchen_helper.queue) > max_open:
+        order_id = next(iter(kitchen_helper.queue.positions))
+        if kitchen_helper.set_order_status(order_id, "delivered") == -1:
+            return -1
+        delivered += 1
+    return delivered
+
+
+# One simulated conversation as a list of payloads
+def conversation(menu, complete_rate, abandon_rate):
+    session_id = uuid.uuid4().hex
+    payloads = []
+    cart = []
+    for _ in range(random.randint(1, 3)):
+        items = random.sample(menu, random.randint(1, 2))
+        cart.extend(items)
+        payloads.append(build_payload(session_id, "order.add - context : ongoing-order", {
+            "food-item": items, "number": [random.randint(1, 3) for _ in items],
+        }))
+    if random.random() < 0.2:
+        payloads.append(build_payload(session_id, "order.remove - context: ongoing-order", {
+            "food-item": [random.choice(cart)],
+        }))
+
+    outcome = random.random()
+    if outcome < complete_rate:
+        payloads.append(build_payload(session_id, "order.complete- context: ongoing-order", {}))
+    elif outcome < complete_rate + abandon_rate:
+        pass
+    else:
+        payloads.append(build_payload(session_id, "track.order - context: ongoing-tracking", {
+            "number": random.randint(1, 1000),
+        }))
+    return payloads
+
+
+def take_sample(counter, latencies, conversations_done):
+    latencies.sort()
+    return {
+        "conversations": conversations_done,
+        "rss_kib": rss_kib(),
+        "traced_kib": tracemalloc.get_traced_memory()[0] // 1024 if tracemalloc.is_tracing() else 0,
+        "open_cursors": counter.open_cursors,
+        "open_connections": counter.open_connections,
+        "open_fds": open_fds(),
+        "carts": len(main.inprogress_orders),
+        "p50_ms": latencies[len(latencies) // 2] if latencies else 0.0,
+        "p99_ms": latencies[max(int(len(latencies) * 0.99) - 1, 0)] if latencies else 0.0,
+    }
+
+
+# Metrics whose last third of samples grew past the first third by more than the tolerance
+def find_growth(samples, warmup):
+    steady = samples[int(len(samples) * warmup):]
+    if len(steady) < 3:
+        return []
+    third = len(steady) // 3
+    failures = []
+    for metric, (relative, absolute) in TOLERANCES.items():
+        first = statistics.mean(sample[metric] for sample in steady[:third])
+        last = statistics.mean(sample[metric] for sample in steady[-third:])
+        if last > first * (1 + relative) + absolute:
+            failures.append(f"{metric} grew from {first:.1f} to {last:.1f}")
+    return failures
+
+
+def print_sample(sample):
+    print("  ".join(f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+                    for key, value in sample.items()), flush=True)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=1000000)
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+    parser.add_argument("--sample-every", type=int, default=10000, help="conversations between samples")
+    parser.add_argument("--endpoint-every", type=int, default=100,
+                        help="conversations between report and export requests")
+    parser.add_argument("--warmup", type=float, default=0.2, help="fraction of samples to ignore")
+    parser.add_argument("--open-orders", type=int, default=500,
+                        help="orders left in progress; older ones are marked delivered")
+    parser.add_argument("--complete-rate", type=float, default=0.6)
+    parser.add_argument("--abandon-rate", type=float, default=0.3)
+    parser.add_argument("--no-tracemalloc", action="store_true", help="skip tracemalloc, which slows the run down")
+    args = parser.parse_args()
+
+    counter = ResourceCounter()
+    counter.install()
+    errors = ErrorCounter()
+    logging.getLogger("pandeyji").addHandler(errors)
+    if not args.no_tracemalloc:
+        tracemalloc.start(10)
+
+    loop = asyncio.new_event_loop()
+    lifespan = main.app.router.lifespan_context(main.app)
+    loop.run_until_complete(lifespan.__aenter__())
+
+    menu = menu_names()
+    warmup_samples = int(args.conversations // args.sample_every * args.warmup)
+    samples = []
+    baseline_snapshot = None
+    latencies = []
+    endpoint_counts = {"report": 0, "export": 0, "aborted export": 0, "failed": 0}
+    delivered_orders = 0
+    failed_deliveries = 0
+    started = time.monotonic()
+
+    for conversations_done in range(1, args.conversations + 1):
+        for payload in conversation(menu, args.complete_rate, args.abandon_rate):
+            start = time.perf_counter()
+            loop.run_until_complete(post_payload(payload))
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        delivered = deliver_orders(args.open_orders)
+        if delivered == -1:
+            failed_deliveries += 1
+        else:
+            delivered_orders += delivered
+
+        if conversations_done % args.endpoint_every == 0:
+            loop.run_until_complete(hit_endpoints(endpoint_counts))
+
+        if conversations_done % args.sample_every == 0:
+            sample = take_sample(counter, latencies, conversations_done)
+            samples.append(sample)
+            print_sample(sample)
+            latencies = []
+            if tracemalloc.is_tracing() and len(samples) == warmup_samples + 1:
+                baseline_snapshot = tracemalloc.take_snapshot()
+
+        if args.duration and time.monotonic() - started > args.duration:
+            break
+
+    loop.run_until_complete(lifespan.__aexit__(None, None, None))
+    loop.close()
+
+    failures = find_growth(samples, args.warmup)
+    if endpoint_counts["failed"]:
+        failures.append(f"{endpoint_counts['failed']} report or export requests did not return 200")
+    if failed_deliveries:
+        failures.append(f"{failed_deliveries} order status updates failed")
+    if errors.count:
+        failures.append(f"the app logged {errors.count} errors")
+    print(f"\n{len(samples)} samples, {len(rate_limit_helper.session_buckets)} rate limit buckets, "
+          f"{len(main.cart_last_seen)} tracked carts, {delivered_orders} orders delivered, "
+          f"{len(kitchen_helper.queue)} in progress")
+    print(", ".join(f"{count} {name} requests" for name, count in endpoint_counts.items()))
+    if tracemalloc.is_tracing() and baseline_snapshot is not None:
+        print("top growing allocators since the first steady sample:")
+        for stat in tracemalloc.take_snapshot().compare_to(baseline_snapshot, "lineno")[:10]:
+            print(f"  {stat}")
+
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK: no metric grew beyond its tolerance")
@@ -0,0 +1,101 @@
+import atexit
+import copy
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import time
+
+import log_helper
+
+# Fraction of webhook payloads to record; 0 turns capturing off
+CAPTURE_SAMPLE_RATE = float(os.getenv("CAPTURE_SAMPLE_RATE", 0))
+CAPTURE_PATH = os.getenv("CAPTURE_PATH", "captures/webhook.ndjson")
+CAPTURE_MAX_BYTES = int(os.getenv("CAPTURE_MAX_BYTES", 10 * 1024 * 1024))
+CAPTURE_BACKUPS = int(os.getenv("CAPTURE_BACKUPS", 5))
+
+# Captures waiting for the writer thread; when it falls this far behind, new ones are dropped
+CAPTURE_QUEUE_SIZE = int(os.getenv("CAPTURE_QUEUE_SIZE", 1000))
+
+# Salt for hashing session IDs; without a fixed salt hashes only match within one process
+CAPTURE_SALT = os.getenv("CAPTURE_SALT") or os.urandom(16).hex()
+
+SESSION_PATTERN = re.compile(r"/sessions/([^/]+)")
+
+logger = log_helper.get_logger("capture")
+
+_capture_logger = None
+_capture_listener = None
+
+
+# The rotating file handler gives us size based rotation. It runs on a writer thread behind
+# the same non-blocking queue handler as the app logs, so the event loop never writes or rotates.
+def get_capture_logger():
+    global _capture_logger, _capture_listener
+    if _capture_logger is None:
+        directory = os.path.dirname(CAPTURE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        writer = logging.handlers.RotatingFileHandler(
+            CAPTURE_PATH, maxBytes=CAPTURE_MAX_BYTES, backupCount=CAPTURE_BACKUPS, encoding="utf-8"
+        )
+        writer.setFormatter(logging.Formatter("%(message)s"))
+        capture_queue = queue.Queue(CAPTURE_QUEUE_SIZE)
+        _capture_listener = logging.handlers.QueueListener(capture_queue, writer)
+        _capture_listener.start()
+
+        capture_logger = logging.getLogger("webhook_capture")
+        capture_logger.setLevel(logging.INFO)
+        capture_logger.propagate = False
+        capture_logger.addHandler(log_helper.NonBlockingQueueHandler(capture_queue))
+        _capture_logger = capture_logger
+    return _capture_logger
+
+
+# Write out whatever is still queued when the process exits
+@atexit.register
+def shutdown():
+    if _capture_listener is not None and _capture_listener._thread is not None:
+        _capture_listener.stop()
+
+
+def anonymize_session_id(session_id: str):
+    return hashlib.sha256((CAPTURE_SALT + session_id).encode("utf-8")).hexdigest()[:32]
+
+
+def anonymize_session_str(session_str: str):
+    return SESSION_PATTERN.sub(
+        lambda match: f"/sessions/{anonymize_session_id(match.group(1))}", session_str
+    )
+
+
+# Copy of the payload with session IDs hashed and the caller's platform details dropped
+def anonymize_payload(payload: dict):
+    payload = copy.deepcopy(payload)
+    payload.pop("originalDetectIntentRequest", None)
+
+    if isinstance(payload.get("session"), str):
+        payload["session"] = anonymize_session_str(payload["session"])
+
+    query_result = payload.get("queryResult", {})
+    for context in query_result.get("outputContexts", []):
+        if isinstance(context.get("name"), str):
+            context["name"] = anonymize_session_str(context["name"])
+
+    return payload
+
+
+# Record a sample of incoming webhook payloads for later replay
+def maybe_capture(payload: dict):
+    if CAPTURE_SAMPLE_RATE <= 0 or random.random() >= CAPTURE_SAMPLE_RATE:
+        return
+
+    try:
+        record = {"captured_at": time.time(), "payload": anonymize_payload(payload)}
+        get_capture_logger().info(json.dumps(record))
+    except Exception as e:
+        logger.error("Error capturing webhook payload", extra={"error": str(e)})
@@ -0,0 +1,22 @@
+--
+-- Order timestamps, so rollups can be bucketed by hour and day.
+-- Rows that already exist get the time this statement runs.
+--
+
+ALTER TABLE `orders`
+  ADD COLUMN `created_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+--
+-- Sales per item and hour, updated whenever an order is completed.
+-- Daily numbers are the sum of the 24 hourly rows of that day.
+--
+
+CREATE TABLE IF NOT EXISTS `sales_rollup` (
+  `sale_date` date NOT NULL,
+  `sale_hour` tinyint NOT NULL,
+  `item_id` int NOT NULL,
+  `quantity` int NOT NULL DEFAULT '0',
+  `revenue` decimal(12,2) NOT NULL DEFAULT '0.00',
+  `order_count` int NOT NULL DEFAULT '0',
+  PRIMARY KEY (`sale_date`,`sale_hour`,`item_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
@@ -0,0 +1,6 @@
+--
+-- insert_order_item and get_price_for_item both look items up by name.
+--
+
+ALTER TABLE `food_items`
+  ADD KEY `idx_food_items_name` (`name`);
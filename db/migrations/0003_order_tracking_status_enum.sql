@@ -0,0 +1,11 @@
+--
+-- Store order status as a one byte enum instead of a varchar, and index it
+-- so the kitchen queue and the archive step can find orders by status.
+-- Values the enum does not know make the ALTER fail instead of being lost.
+--
+
+UPDATE `order_tracking` SET `status` = LOWER(TRIM(`status`));
+
+ALTER TABLE `order_tracking`
+  MODIFY `status` enum('in progress','in transit','delivered','cancelled') NOT NULL DEFAULT 'in progress',
+  ADD KEY `idx_order_tracking_status` (`status`);
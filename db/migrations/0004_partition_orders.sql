@@ -0,0 +1,23 @@
+--
+-- Range partition orders by order_id, so lookups of recent orders only touch
+-- the newest partition and old partitions can be archived or dropped whole.
+-- Partitioned InnoDB tables cannot have foreign keys, so orders_ibfk_1 is
+-- dropped; insert_order_item only ever inserts item IDs it read from food_items.
+--
+
+ALTER TABLE `orders` DROP FOREIGN KEY `orders_ibfk_1`;
+
+ALTER TABLE `orders`
+  PARTITION BY RANGE (`order_id`) (
+    PARTITION p0 VALUES LESS THAN (500000),
+    PARTITION p1 VALUES LESS THAN (1000000),
+    PARTITION p2 VALUES LESS THAN (1500000),
+    PARTITION p3 VALUES LESS THAN (2000000),
+    PARTITION p4 VALUES LESS THAN (2500000),
+    PARTITION p5 VALUES LESS THAN (3000000),
+    PARTITION p6 VALUES LESS THAN (3500000),
+    PARTITION p7 VALUES LESS THAN (4000000),
+    PARTITION p8 VALUES LESS THAN (4500000),
+    PARTITION p9 VALUES LESS THAN (5000000),
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+  );
@@ -0,0 +1,19 @@
+--
+-- Delivered orders are moved here by: python migration_helper.py archive
+--
+
+CREATE TABLE IF NOT EXISTS `orders_archive` (
+  `order_id` int NOT NULL,
+  `item_id` int NOT NULL,
+  `quantity` int DEFAULT NULL,
+  `total_price` decimal(10,2) DEFAULT NULL,
+  `created_at` datetime NOT NULL,
+  PRIMARY KEY (`order_id`,`item_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+CREATE TABLE IF NOT EXISTS `order_tracking_archive` (
+  `order_id` int NOT NULL,
+  `status` enum('in progress','in transit','delivered','cancelled') NOT NULL,
+  `archived_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`order_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
@@ -0,0 +1,17 @@
+--
+-- Minutes of kitchen work per portion, used for delivery estimates.
+-- Items added later get the default until their prep time is set.
+--
+
+ALTER TABLE `food_items`
+  ADD COLUMN `prep_minutes` smallint NOT NULL DEFAULT '8';
+
+UPDATE `food_items` SET `prep_minutes` = 8 WHERE `name` = 'Pav Bhaji';
+UPDATE `food_items` SET `prep_minutes` = 10 WHERE `name` = 'Chole Bhature';
+UPDATE `food_items` SET `prep_minutes` = 15 WHERE `name` = 'Pizza';
+UPDATE `food_items` SET `prep_minutes` = 3 WHERE `name` = 'Mango Lassi';
+UPDATE `food_items` SET `prep_minutes` = 10 WHERE `name` = 'Masala Dosa';
+UPDATE `food_items` SET `prep_minutes` = 20 WHERE `name` = 'Vegetable Biryani';
+UPDATE `food_items` SET `prep_minutes` = 5 WHERE `name` = 'Vada Pav';
+UPDATE `food_items` SET `prep_minutes` = 10 WHERE `name` = 'Rava Dosa';
+UPDATE `food_items` SET `prep_minutes` = 4 WHERE `name` = 'Samosa';
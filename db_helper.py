@@ -1,30 +1,27 @@
+import heapq
 import os
 import mysql.connector
 
-# Database connection setup
-cnx = mysql.connector.connect(
-    host=os.getenv("DB_HOST"),
-    port=int(os.getenv("DB_PORT", 3306)),  # Default to 3306 if DB_PORT is not set
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASSWORD"),
-    database=os.getenv("DB_NAME")
-)
+import log_helper
 
-# Insert tracking info into the database
-def insert_order_tracking(order_id, status):
-    try:
-        cursor = cnx.cursor()
-        insert_query = "INSERT INTO order_tracking (order_id, status) VALUES (%s, %s)"
-        cursor.execute(insert_query, (order_id, status))
-        cnx.commit()
-    except mysql.connector.Error as err:
-        print(f"Error inserting order tracking: {err}")
-        cnx.rollback()
-    finally:
-        cursor.close()
+logger = log_helper.get_logger("db")
+
+# Open a new database connection using environment variables
+def connect():
+    return mysql.connector.connect(
+        host=os.getenv("DB_HOST"),
+        port=int(os.getenv("DB_PORT", 3306)),  # Default to 3306 if DB_PORT is not set
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        database=os.getenv("DB_NAME")
+    )
+
+# Database connection setup
+cnx = connect()
 
 # Get total order price for a given order ID
 def get_total_order_price(order_id):
+    cursor = None
     try:
         cursor = cnx.cursor()
         query = "SELECT get_total_order_price(%s)"
@@ -34,35 +31,18 @@ def get_total_order_price(order_id):
         if result is not None:
             return result[0]
         else:
-            print(f"No total price found for order ID {order_id}")
+            logger.warning("No total price found", extra={"order_id": order_id})
             return 0  # Return a default value if not found
     except mysql.connector.Error as err:
-        print(f"Error fetching total order price: {err}")
+        logger.error("Error fetching total order price", extra={"order_id": order_id, "error": str(err)})
         return 0
     finally:
-        cursor.close()
-
-# Insert a food item into an order
-def insert_order_item(food_item, quantity, order_id):
-    try:
-        cursor = cnx.cursor()
-        cursor.callproc('insert_order_item', (food_item, quantity, order_id))
-        cnx.commit()
-        print(f"Order item {food_item} inserted successfully!")
-        return 1
-    except mysql.connector.Error as err:
-        print(f"Error inserting order item: {err}")
-        cnx.rollback()
-        return -1
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        cnx.rollback()
-        return -1
-    finally:
-        cursor.close()
+        if cursor is not None:
+            cursor.close()
 
 # Get the next available order ID
 def get_next_order_id():
+    cursor = None
     try:
         cursor = cnx.cursor()
         query = "SELECT MAX(order_id) FROM orders"
@@ -73,29 +53,342 @@ def get_next_order_id():
             return 1  # Start from 1 if no orders are in the database
         return result[0] + 1
     except mysql.connector.Error as err:
-        print(f"Error fetching next order ID: {err}")
+        logger.error("Error fetching next order ID", extra={"error": str(err)})
         return -1
     finally:
-        cursor.close()
+        if cursor is not None:
+            cursor.close()
 
 # Get the status of an order
 def get_order_status(order_id: int):
+    cursor = None
     try:
         cursor = cnx.cursor()
         query = "SELECT status FROM order_tracking WHERE order_id = %s"
         cursor.execute(query, (order_id,))
         
+        result = cursor.fetchone()
+        if result is not None:
+            return result[0]
+
+        # Delivered orders may have been moved to the archive
+        query = "SELECT status FROM order_tracking_archive WHERE order_id = %s"
+        cursor.execute(query, (order_id,))
+
         result = cursor.fetchone()
         if result is not None:
             return result[0]
         else:
             return None
     except mysql.connector.Error as err:
-        print(f"Error fetching order status: {err}")
+        logger.error("Error fetching order status", extra={"order_id": order_id, "error": str(err)})
         return None
     finally:
-        cursor.close()
+        if cursor is not None:
+            cursor.close()
+
+# Update the status of an order
+def update_order_status(order_id, status):
+    cursor = None
+    try:
+        cursor = cnx.cursor()
+        query = "UPDATE order_tracking SET status = %s WHERE order_id = %s"
+        cursor.execute(query, (status, order_id))
+        cnx.commit()
+        return cursor.rowcount
+    except mysql.connector.Error as err:
+        logger.error("Error updating order status", extra={"order_id": order_id, "status": status, "error": str(err)})
+        cnx.rollback()
+        return -1
+    finally:
+        if cursor is not None:
+            cursor.close()
+
+# Get the prep minutes and quantity of every item of the orders that are still in progress.
+# The kitchen queue reloads from a background thread, so this uses its own connection.
+def get_open_order_items():
+    kitchen_cnx = None
+    cursor = None
+    try:
+        kitchen_cnx = connect()
+        cursor = kitchen_cnx.cursor()
+        query = (
+            "SELECT o.order_id, f.prep_minutes, o.quantity "
+            "FROM order_tracking t "
+            "JOIN orders o ON o.order_id = t.order_id "
+            "JOIN food_items f ON f.item_id = o.item_id "
+            "WHERE t.status = 'in progress'"
+        )
+        cursor.execute(query)
+        return cursor.fetchall()
+    except mysql.connector.Error as err:
+        logger.error("Error fetching open orders", extra={"error": str(err)})
+        return None
+    finally:
+        if cursor is not None:
+            cursor.close()
+        if kitchen_cnx is not None:
+            kitchen_cnx.close()
+
+# Get every food item with its price and prep time.
+# The menu snapshot is refreshed from a background thread, so this uses its own connection.
+def get_food_items():
+    menu_cnx = None
+    cursor = None
+    try:
+        menu_cnx = connect()
+        cursor = menu_cnx.cursor()
+        query = "SELECT item_id, name, price, prep_minutes FROM food_items"
+        cursor.execute(query)
+        return cursor.fetchall()
+    except mysql.connector.Error as err:
+        logger.error("Error fetching food items", extra={"error": str(err)})
+        return None
+    finally:
+        if cursor is not None:
+            cursor.close()
+        if menu_cnx is not None:
+            menu_cnx.close()
+
+# Get the names of the given food items that exist
+def get_food_item_names(names):
+    cursor = None
+    try:
+        cursor = cnx.cursor()
+        placeholders = ", ".join(["%s"] * len(names))
+        query = f"SELECT name FROM food_items WHERE name IN ({placeholders})"
+        cursor.execute(query, list(names))
+        return [row[0] for row in cursor.fetchall()]
+    except mysql.connector.Error as err:
+        logger.error("Error fetching food item names", extra={"error": str(err)})
+        return None
+    finally:
+        if cursor is not None:
+            cursor.close()
 
+# Insert the items, the tracking row and the sales rollup of an order in one
+# transaction, so the rollup never counts an order that is not in the orders table
+def insert_order(order_id, food_dict, status):
+    cursor = None
+    try:
+        cursor = cnx.cursor()
+        for food_item, quantity in food_dict.items():
+            cursor.callproc('insert_order_item', (food_item, quantity, order_id))
+
+        insert_query = "INSERT INTO order_tracking (order_id, status) VALUES (%s, %s)"
+        cursor.execute(insert_query, (order_id, status))
+
+        rollup_query = (
+            "INSERT INTO sales_rollup (sale_date, sale_hour, item_id, quantity, revenue, order_count) "
+            "SELECT * FROM ("
+            "  SELECT DATE(created_at) AS sale_date, HOUR(created_at) AS sale_hour, item_id, "
+            "         quantity, total_price AS revenue, 1 AS order_count "
+            "  FROM orders WHERE order_id = %s"
+            ") AS new "
+            "ON DUPLICATE KEY UPDATE "
+            "quantity = sales_rollup.quantity + new.quantity, "
+            "revenue = sales_rollup.revenue + new.revenue, "
+            "order_count = sales_rollup.order_count + new.order_count"
+        )
+        cursor.execute(rollup_query, (order_id,))
+        cnx.commit()
+        log_helper.log_success(logger, "Order inserted", order_id=order_id, items=len(food_dict))
+        return 1
+    except mysql.connector.Error as err:
+        logger.error("Error inserting order", extra={"order_id": order_id, "error": str(err)})
+        cnx.rollback()
+        return -1
+    finally:
+        if cursor is not None:
+            cursor.close()
+
+# Add the live and archived orders with after_order_id < order_id <= up_to_order_id to a rollup table
+def add_orders_to_rollup(cursor, table, after_order_id, up_to_order_id):
+    query = (
+        f"INSERT INTO {table} (sale_date, sale_hour, item_id, quantity, revenue, order_count) "
+        "SELECT * FROM ("
+        "  SELECT DATE(created_at) AS sale_date, HOUR(created_at) AS sale_hour, item_id, "
+        "         SUM(quantity) AS quantity, SUM(total_price) AS revenue, COUNT(*) AS order_count "
+        "  FROM ("
+        "    SELECT created_at, item_id, quantity, total_price FROM orders "
+        "    WHERE order_id > %s AND order_id <= %s "
+        "    UNION ALL "
+        "    SELECT created_at, item_id, quantity, total_price FROM orders_archive "
+        "    WHERE order_id > %s AND order_id <= %s"
+        "  ) AS all_orders "
+        "  GROUP BY DATE(created_at), HOUR(created_at), item_id"
+        ") AS new "
+        "ON DUPLICATE KEY UPDATE "
+        f"quantity = {table}.quantity + new.quantity, "
+        f"revenue = {table}.revenue + new.revenue, "
+        f"order_count = {table}.order_count + new.order_count"
+    )
+    cursor.execute(query, (after_order_id, up_to_order_id, after_order_id, up_to_order_id))
+
+
+def get_max_order_id(cursor):
+    cursor.execute("SELECT COALESCE(MAX(order_id), 0) FROM orders")
+    return cursor.fetchone()[0]
+
+
+# Rebuild the sales rollup from every live and archived order without stopping order inserts.
+# The new rollup is built in sales_rollup_new up to the newest order at the start, then catches
+# up with the orders placed meanwhile. Only the last few orders and the RENAME that swaps the
+# tables run with the tables locked.
+def rebuild_sales_rollup(catch_up_orders=1000):
+    rollup_cnx = None
+    cursor = None
+    try:
+        rollup_cnx = connect()
+        cursor = rollup_cnx.cursor()
+        # No gap locks on the scanned orders, so inserting new orders never waits for the scan
+        cursor.execute("SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED")
+        cursor.execute("DROP TABLE IF EXISTS sales_rollup_new, sales_rollup_old")
+        cursor.execute("CREATE TABLE sales_rollup_new LIKE sales_rollup")
+
+        high_water_mark = get_max_order_id(cursor)
+        add_orders_to_rollup(cursor, "sales_rollup_new", 0, high_water_mark)
+        rollup_cnx.commit()
+
+        # Catch up with the orders placed during the build until only a few are left
+        while True:
+            latest_order_id = get_max_order_id(cursor)
+            if latest_order_id - high_water_mark <= catch_up_orders:
+                break
+            add_orders_to_rollup(cursor, "sales_rollup_new", high_water_mark, latest_order_id)
+            rollup_cnx.commit()
+            high_water_mark = latest_order_id
+
+        cursor.execute("LOCK TABLES sales_rollup WRITE, sales_rollup_new WRITE, orders READ, orders_archive READ")
+        latest_order_id = get_max_order_id(cursor)
+        add_orders_to_rollup(cursor, "sales_rollup_new", high_water_mark, latest_order_id)
+        cursor.execute("SELECT COUNT(*) FROM sales_rollup_new")
+        rebuilt_rows = cursor.fetchone()[0]
+        cursor.execute("RENAME TABLE sales_rollup TO sales_rollup_old, sales_rollup_new TO sales_rollup")
+        cursor.execute("UNLOCK TABLES")
+        cursor.execute("DROP TABLE sales_rollup_old")
+        return rebuilt_rows
+    except mysql.connector.Error as err:
+        logger.error("Error rebuilding sales rollup", extra={"error": str(err)})
+        if rollup_cnx is not None:
+            rollup_cnx.rollback()
+        return -1
+    finally:
+        if cursor is not None:
+            try:
+                cursor.execute("UNLOCK TABLES")
+            except mysql.connector.Error as err:
+                logger.error("Error unlocking tables after the rollup rebuild", extra={"error": str(err)})
+            cursor.close()
+        if rollup_cnx is not None:
+            rollup_cnx.close()
+
+# Get the rolled up sales of a day, per item and optionally per hour.
+# Reports run outside the webhook's handler slot, so they use their own connection.
+def get_sales_rollup(sale_date, by_hour=False):
+    report_cnx = None
+    cursor = None
+    try:
+        report_cnx = connect()
+        cursor = report_cnx.cursor()
+        if by_hour:
+            query = (
+                "SELECT r.sale_hour, f.name, r.quantity, r.revenue, r.order_count "
+                "FROM sales_rollup r JOIN food_items f ON f.item_id = r.item_id "
+                "WHERE r.sale_date = %s "
+                "ORDER BY r.sale_hour, f.name"
+            )
+        else:
+            query = (
+                "SELECT f.name, SUM(r.quantity), SUM(r.revenue), SUM(r.order_count) "
+                "FROM sales_rollup r JOIN food_items f ON f.item_id = r.item_id "
+                "WHERE r.sale_date = %s "
+                "GROUP BY f.name "
+                "ORDER BY SUM(r.revenue) DESC"
+            )
+        cursor.execute(query, (sale_date,))
+        return cursor.fetchall()
+    except mysql.connector.Error as err:
+        logger.error("Error fetching sales rollup", extra={"sale_date": str(sale_date), "error": str(err)})
+        return None
+    finally:
+        if cursor is not None:
+            cursor.close()
+        if report_cnx is not None:
+            report_cnx.close()
+
+
+# Order items of one table joined with item names and statuses, in primary key order
+def select_order_rows(cursor, orders_table, tracking_table, after_order_id, end_order_id):
+    query = (
+        "SELECT o.order_id, o.item_id, f.name, o.quantity, o.total_price, t.status, o.created_at "
+        f"FROM {orders_table} o "
+        "JOIN food_items f ON f.item_id = o.item_id "
+        f"LEFT JOIN {tracking_table} t ON t.order_id = o.order_id "
+        "WHERE o.order_id > %s"
+    )
+    params = [after_order_id]
+    if end_order_id is not None:
+        query += " AND o.order_id <= %s"
+        params.append(end_order_id)
+    query += " ORDER BY o.order_id, o.item_id"
+    cursor.execute(query, params)
+
+def fetch_rows(cursor, chunk_size):
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
+
+# Close export cursors and connections, even when a cursor still has unread rows
+def close_export(cursors, connections):
+    for cursor in cursors:
+        # A client that disconnects mid-export leaves rows unread, and closing the
+        # cursor then raises; the connection is closed either way, discarding them
+        try:
+            cursor.close()
+        except mysql.connector.Error as err:
+            logger.info("Closing export cursor with unread rows", extra={"error": str(err)})
+    for export_cnx in connections:
+        try:
+            export_cnx.close()
+        except mysql.connector.Error as err:
+            logger.info("Closing export connection", extra={"error": str(err)})
+
+# Stream live and archived order items joined with item names and statuses, in order_id order.
+# Each table is read in primary key order through its own connection and unbuffered cursor,
+# and the two are merged here, so the server never sorts or materialises the export and only
+# one chunk is in memory at a time.
+def stream_orders(after_order_id=0, end_order_id=None, chunk_size=1000):
+    connections = []
+    cursors = []
+    try:
+        # Live orders are read first: an order archived in between is then seen twice, never missed
+        for orders_table, tracking_table in (("orders", "order_tracking"), ("orders_archive", "order_tracking_archive")):
+            export_cnx = connect()
+            connections.append(export_cnx)
+            cursor = export_cnx.cursor(buffered=False)
+            cursors.append(cursor)
+            select_order_rows(cursor, orders_table, tracking_table, after_order_id, end_order_id)
+
+        merged = heapq.merge(
+            *(fetch_rows(cursor, chunk_size) for cursor in cursors), key=lambda row: (row[0], row[1])
+        )
+        rows = []
+        last_key = None
+        for row in merged:
+            if (row[0], row[1]) == last_key:
+                continue
+            last_key = (row[0], row[1])
+            rows.append(row)
+            if len(rows) == chunk_size:
+                yield rows
+                rows = []
+        if rows:
+            yield rows
+    finally:
+        close_export(cursors, connections)
 
 
 
@@ -0,0 +1,153 @@
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+
+import db_helper
+
+EXPORT_COLUMNS = ["order_id", "item_id", "item_name", "quantity", "total_price", "status", "created_at"]
+
+
+def row_to_dict(row):
+    order_id, item_id, item_name, quantity, total_price, status, created_at = row
+    return {
+        "order_id": order_id,
+        "item_id": item_id,
+        "item_name": item_name,
+        "quantity": quantity,
+        "total_price": str(total_price) if total_price is not None else None,
+        "status": status,
+        "created_at": created_at.isoformat() if created_at is not None else None,
+    }
+
+
+# Turn a chunk of order rows into CSV text
+def format_csv(rows, header=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        values = row_to_dict(row)
+        writer.writerow([values[column] for column in EXPORT_COLUMNS])
+    return buffer.getvalue()
+
+
+# Turn a chunk of order rows into NDJSON text
+def format_ndjson(rows):
+    return "".join(json.dumps(row_to_dict(row)) + "\n" for row in rows)
+
+
+# Yield export text chunk by chunk, so the whole export is never held in memory
+def iter_export(export_format="ndjson", after_order_id=0, end_order_id=None, chunk_size=1000):
+    header = export_format == "csv"
+    for rows in db_helper.stream_orders(after_order_id, end_order_id, chunk_size):
+        if export_format == "csv":
+            yield format_csv(rows, header)
+            header = False
+        else:
+            yield format_ndjson(rows)
+
+
+def read_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+# Write the checkpoint to a temporary file first so a crash never leaves it half written
+def write_checkpoint(path, last_order_id, offset):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"last_order_id": last_order_id, "offset": offset}, f)
+    os.replace(tmp_path, path)
+
+
+# Export orders to a file, checkpointing after every complete order at chunk boundaries.
+# On resume the output is truncated back to the last checkpoint, so no order is written twice.
+def export_to_file(output_path, export_format, start_id, end_id, chunk_size, checkpoint_path):
+    after_order_id = max(start_id - 1, 0)
+    offset = 0
+    checkpoint = read_checkpoint(checkpoint_path) if checkpoint_path else None
+    if checkpoint:
+        after_order_id = checkpoint["last_order_id"]
+        offset = checkpoint["offset"]
+
+    # Resuming into a missing or shorter file would pad the gap with NUL bytes
+    if offset:
+        if not os.path.exists(output_path) or os.path.getsize(output_path) < offset:
+            raise ValueError(
+                f"Checkpoint {checkpoint_path} expects {offset} bytes in {output_path}, but the file is "
+                f"missing or shorter. Restore the file or delete the checkpoint to start over."
+            )
+
+    mode = "r+" if offset else "w"
+    with open(output_path, mode, newline="") as out:
+        out.seek(offset)
+        out.truncate()
+
+        header = export_format == "csv" and offset == 0
+        last_complete_order_id = after_order_id
+        pending = []
+
+        for rows in db_helper.stream_orders(after_order_id, end_id, chunk_size):
+            pending.extend(rows)
+
+            # Rows of the last order in this chunk may continue in the next one
+            last_order_id = pending[-1][0]
+            complete = [row for row in pending if row[0] != last_order_id]
+            pending = [row for row in pending if row[0] == last_order_id]
+            if not complete:
+                continue
+
+            if export_format == "csv":
+                out.write(format_csv(complete, header))
+                header = False
+            else:
+                out.write(format_ndjson(complete))
+            last_complete_order_id = complete[-1][0]
+
+            if checkpoint_path:
+                out.flush()
+                write_checkpoint(checkpoint_path, last_complete_order_id, out.tell())
+
+        if pending:
+            if export_format == "csv":
+                out.write(format_csv(pending, header))
+            else:
+                out.write(format_ndjson(pending))
+            last_complete_order_id = pending[-1][0]
+
+        out.flush()
+        if checkpoint_path:
+            write_checkpoint(checkpoint_path, last_complete_order_id, out.tell())
+
+    return last_complete_order_id
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Export orders with item names and statuses.")
+    parser.add_argument("--format", choices=["csv", "ndjson"], default="ndjson")
+    parser.add_argument("--start-id", type=int, default=1, help="first order ID to export")
+    parser.add_argument("--end-id", type=int, default=None, help="last order ID to export")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--output", default=None, help="output file (defaults to stdout)")
+    parser.add_argument("--checkpoint", default=None, help="checkpoint file used to resume an export (needs --output)")
+    args = parser.parse_args()
+
+    if args.output:
+        try:
+            last_order_id = export_to_file(
+                args.output, args.format, args.start_id, args.end_id, args.chunk_size, args.checkpoint
+            )
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"Exported orders up to order ID {last_order_id}.", file=sys.stderr)
+    else:
+        for text in iter_export(args.format, max(args.start_id - 1, 0), args.end_id, args.chunk_size):
+            sys.stdout.write(text)
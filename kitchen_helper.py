@@ -0,0 +1,216 @@
+import math
+import os
+import sys
+import threading
+
+import db_helper
+import log_helper
+import menu_helper
+
+# Minutes of kitchen work per portion for items the menu snapshot does not know
+DEFAULT_PREP_MINUTES = int(os.getenv("DEFAULT_PREP_MINUTES", 8))
+
+# Portions the kitchen works on at the same time, and the time from kitchen to door
+KITCHEN_STATIONS = int(os.getenv("KITCHEN_STATIONS", 3))
+DELIVERY_MINUTES = int(os.getenv("DELIVERY_MINUTES", 20))
+
+# Status changes made outside this process are picked up by reloading the queue this often
+KITCHEN_RESYNC_SECONDS = float(os.getenv("KITCHEN_RESYNC_SECONDS", 60))
+
+logger = log_helper.get_logger("kitchen")
+
+
+# Minutes of kitchen work per portion, stored with the item in food_items.prep_minutes
+def prep_minutes(food_item: str):
+    item = menu_helper.get_item(food_item)
+    return item[3] if item is not None else DEFAULT_PREP_MINUTES
+
+
+def order_weight(food_dict: dict):
+    return sum(prep_minutes(food_item) * int(quantity) for food_item, quantity in food_dict.items())
+
+
+class KitchenQueue:
+    """Open orders in the order they reached the kitchen, with their prep minutes.
+
+    A Fenwick tree over arrival positions gives the work queued ahead of any
+    order in O(log n), so opening, closing and estimating never scan the queue.
+    """
+
+    def __init__(self):
+        self.positions = {}
+        self.weights = [0]
+        self.tree = [0]
+        self.total_weight = 0
+
+    def __len__(self):
+        return len(self.positions)
+
+    def prefix(self, position: int):
+        total = 0
+        while position > 0:
+            total += self.tree[position]
+            position -= position & -position
+        return total
+
+    def add(self, position: int, delta: int):
+        while position < len(self.tree):
+            self.tree[position] += delta
+            position += position & -position
+
+    def open(self, order_id: int, weight: int):
+        if order_id in self.positions:
+            self.close(order_id)
+        position = len(self.tree)
+        low = position - (position & -position)
+        self.tree.append(weight + self.prefix(position - 1) - self.prefix(low))
+        self.weights.append(weight)
+        self.positions[order_id] = position
+        self.total_weight += weight
+
+    def close(self, order_id: int):
+        position = self.positions.pop(order_id, None)
+        if position is None:
+            return
+        weight = self.weights[position]
+        self.weights[position] = 0
+        self.add(position, -weight)
+        self.total_weight -= weight
+
+        # Drop closed positions once they outnumber the open ones
+        if len(self.weights) > 2 * len(self.positions) + 1024:
+            self.compact()
+
+    def compact(self):
+        live = sorted(self.positions.items(), key=lambda entry: entry[1])
+        weights = [self.weights[position] for _, position in live]
+        self.positions = {}
+        self.weights = [0]
+        self.tree = [0]
+        self.total_weight = 0
+        for (order_id, _), weight in zip(live, weights):
+            self.open(order_id, weight)
+
+    # Minutes of prep work queued before this order, or before a new order if it is not in the queue
+    def weight_ahead(self, order_id: int = None):
+        position = self.positions.get(order_id)
+        if position is None:
+            return self.total_weight
+        return self.prefix(position - 1)
+
+    def weight_of(self, order_id: int):
+        position = self.positions.get(order_id)
+        return self.weights[position] if position is not None else 0
+
+
+queue = KitchenQueue()
+
+# Opens and closes made while the queue is being reloaded, applied to the new queue before it is swapped in
+_changes_during_sync = None
+_queue_lock = threading.Lock()
+
+
+def apply_change(target: KitchenQueue, change):
+    action, order_id, weight = change
+    if action == "open":
+        target.open(order_id, weight)
+    else:
+        target.close(order_id)
+
+
+# Rebuild the queue from the 'in progress' orders in the database
+def load_from_db():
+    global queue, _changes_during_sync
+    with _queue_lock:
+        _changes_during_sync = []
+    rows = db_helper.get_open_order_items()
+
+    new_queue = None
+    if rows is not None:
+        # Prep minutes come with the rows, so this thread never touches the menu snapshot
+        open_orders = {}
+        for order_id, item_prep_minutes, quantity in rows:
+            open_orders[order_id] = open_orders.get(order_id, 0) + item_prep_minutes * int(quantity)
+
+        new_queue = KitchenQueue()
+        for order_id in sorted(open_orders):
+            new_queue.open(order_id, open_orders[order_id])
+
+    with _queue_lock:
+        if new_queue is not None:
+            for change in _changes_during_sync:
+                apply_change(new_queue, change)
+            queue = new_queue
+        _changes_during_sync = None
+
+
+_resync_thread = None
+_stop_resync = threading.Event()
+
+
+def resync_forever():
+    while not _stop_resync.wait(KITCHEN_RESYNC_SECONDS):
+        try:
+            load_from_db()
+        except Exception as e:
+            logger.error("Error reloading kitchen queue", extra={"error": str(e)})
+
+
+# Reload the queue every KITCHEN_RESYNC_SECONDS on a background thread, never in a request
+def start_resync():
+    global _resync_thread
+    _stop_resync.clear()
+    _resync_thread = threading.Thread(target=resync_forever, name="kitchen-resync", daemon=True)
+    _resync_thread.start()
+
+
+# Stop the background reload, waiting for a reload that is running to finish
+def stop_resync(timeout: float = 10):
+    _stop_resync.set()
+    if _resync_thread is not None:
+        _resync_thread.join(timeout)
+
+
+def record_change(change):
+    with _queue_lock:
+        apply_change(queue, change)
+        if _changes_during_sync is not None:
+            _changes_during_sync.append(change)
+
+
+# Called once an order's tracking row has been inserted as 'in progress'
+def order_opened(order_id: int, food_dict: dict):
+    record_change(("open", order_id, order_weight(food_dict)))
+
+
+def order_status_changed(order_id: int, status: str):
+    if status == "in progress":
+        return
+    record_change(("close", order_id, 0))
+
+
+# Update an order's status in the database and in the kitchen queue
+def set_order_status(order_id: int, status: str):
+    if db_helper.update_order_status(order_id, status) == -1:
+        return -1
+    order_status_changed(order_id, status)
+    return 1
+
+
+# Estimated minutes until an 'in progress' order reaches the customer
+def eta_minutes(order_id: int):
+    with _queue_lock:
+        work_minutes = queue.weight_ahead(order_id) + queue.weight_of(order_id)
+    return math.ceil(work_minutes / max(KITCHEN_STATIONS, 1)) + DELIVERY_MINUTES
+
+
+if __name__ == "__main__":
+
+    # Kitchen staff update an order: python kitchen_helper.py <order_id> "<status>"
+    if len(sys.argv) == 3:
+        if set_order_status(int(sys.argv[1]), sys.argv[2]) == -1:
+            sys.exit(1)
+        print(f"Order {sys.argv[1]} is now {sys.argv[2]}.")
+    else:
+        load_from_db()
+        print(f"{len(queue)} orders in progress, {queue.total_weight} minutes of prep work queued.")
@@ -0,0 +1,115 @@
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Fraction of high volume success events that are written; errors are always written
+LOG_SUCCESS_SAMPLE_RATE = float(os.getenv("LOG_SUCCESS_SAMPLE_RATE", 0.01))
+
+# Records waiting for the writer thread; when it falls this far behind, new records are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+# Correlation ID of the webhook request being handled, carried into every DB call it makes
+correlation_id = contextvars.ContextVar("correlation_id", default="-")
+
+RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "correlation_id"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+            "correlation_id": getattr(record, "correlation_id", "-"),
+        }
+        for key, value in vars(record).items():
+            if key not in RESERVED_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread without formatting them or waiting on the queue."""
+
+    dropped = 0
+
+    # The queue does its own locking, so skip the handler lock taken by Handler.handle
+    def handle(self, record):
+        if self.filter(record):
+            self.enqueue(self.prepare(record))
+            return True
+        return False
+
+    def prepare(self, record):
+        # The correlation ID is read here, in the thread that logged the record
+        record.correlation_id = correlation_id.get()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+def configure(stream=None):
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    writer = logging.StreamHandler(stream or sys.stdout)
+    writer.setFormatter(JsonFormatter())
+    listener = logging.handlers.QueueListener(log_queue, writer, respect_handler_level=False)
+
+    app_logger = logging.getLogger("pandeyji")
+    for handler in list(app_logger.handlers):
+        app_logger.removeHandler(handler)
+    app_logger.addHandler(NonBlockingQueueHandler(log_queue))
+    app_logger.setLevel(LOG_LEVEL)
+    app_logger.propagate = False
+
+    listener.start()
+    return listener
+
+
+_listener = configure()
+
+
+# Write out whatever is still queued when the process exits
+@atexit.register
+def shutdown():
+    if _listener._thread is not None:
+        _listener.stop()
+
+
+def get_logger(name: str):
+    return logging.getLogger(f"pandeyji.{name}")
+
+
+def new_correlation_id(candidate: str = ""):
+    value = candidate or uuid.uuid4().hex
+    correlation_id.set(value)
+    return value
+
+
+# Log a success event, keeping only a LOG_SUCCESS_SAMPLE_RATE fraction of them
+def log_success(logger, event: str, **fields):
+    if LOG_SUCCESS_SAMPLE_RATE < 1 and random.random() >= LOG_SUCCESS_SAMPLE_RATE:
+        return
+    fields["sample_rate"] = LOG_SUCCESS_SAMPLE_RATE
+    logger.info(event, extra=fields)
@@ -175,20 +175,113 @@ def track_order(parameters: dict, session_id: str):
 
 
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from collections import OrderedDict
+import contextlib
+import datetime
+import os
+import time
+import analytics_helper
+import capture_helper
 import db_helper
+import export_helper
 import generic_helper
+import kitchen_helper
+import log_helper
+import menu_helper
+import rate_limit_helper
+import recommend_helper
+
+logger = log_helper.get_logger("webhook")
+
+RETRY_TEXT = "We are receiving a lot of requests right now. Please try again in a moment."
+
+
+# Publish a new menu snapshot if food_items changed since the last one
+def refresh_menu_snapshot():
+    try:
+        menu_helper.refresh_from_db()
+    except Exception as e:
+        logger.error("Error refreshing menu snapshot", extra={"error": str(e)})
+
+
+# Load the kitchen queue of 'in progress' orders used for delivery estimates,
+# then keep reloading it in the background to pick up status changes made elsewhere
+def load_kitchen_queue():
+    try:
+        kitchen_helper.load_from_db()
+    except Exception as e:
+        logger.error("Error loading kitchen queue", extra={"error": str(e)})
+    kitchen_helper.start_resync()
+
+
+# Runs around the life of a worker: the menu snapshot and kitchen queue are ready before the
+# first request, the "frequently ordered together" index loads in the background (complete_order
+# keeps it up to date), and the background threads are stopped on shutdown
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    refresh_menu_snapshot()
+    recommend_helper.start_loading()
+    load_kitchen_queue()
+    try:
+        yield
+    finally:
+        kitchen_helper.stop_resync()
+        recommend_helper.stop_loading()
+
+
+app = FastAPI(lifespan=lifespan)
 
-app = FastAPI()
 
 # Dictionary to track in-progress orders for sessions
 inprogress_orders = {}
 
+# Session ID -> last time its cart changed, oldest first. Carts nobody has
+# touched for CART_TTL_SECONDS are abandoned and dropped.
+CART_TTL_SECONDS = float(os.getenv("CART_TTL_SECONDS", 30 * 60))
+cart_last_seen = OrderedDict()
+
+
+def touch_cart(session_id: str):
+    cart_last_seen[session_id] = time.monotonic()
+    cart_last_seen.move_to_end(session_id)
+
+
+def forget_cart(session_id: str):
+    inprogress_orders.pop(session_id, None)
+    cart_last_seen.pop(session_id, None)
+
+
+def expire_abandoned_carts():
+    expire_before = time.monotonic() - CART_TTL_SECONDS
+    while cart_last_seen:
+        session_id, last_seen = next(iter(cart_last_seen.items()))
+        if last_seen > expire_before:
+            break
+        forget_cart(session_id)
+
+
+# Handlers block on the database, so they run in the threadpool and the event loop
+# stays free to turn away requests once the limiter's wait queue is full
+async def run_handler(handler, parameters: dict, session_id: str):
+    return await run_in_threadpool(handler, parameters, session_id)
+
+
 @app.post("/")
 async def handle_request(request: Request):
+    started = time.perf_counter()
+    intent = None
     try:
         # Parse the Dialogflow payload
         payload = await request.json()
+
+        # Tag every log line of this request, including DB calls, with one correlation ID
+        log_helper.new_correlation_id(request.headers.get("x-correlation-id") or payload.get("responseId", ""))
+
+        # Record a sample of the traffic for replay (off unless CAPTURE_SAMPLE_RATE is set)
+        capture_helper.maybe_capture(payload)
+
         intent = payload['queryResult']['intent']['displayName']
         parameters = payload['queryResult']['parameters']
         output_context = payload['queryResult'].get('outputContexts', [])
@@ -198,6 +291,10 @@ async def handle_request(request: Request):
         if output_context:
             session_id = generic_helper.extract_session_id(output_context[0].get('name', ''))
 
+        # Reject sessions that are sending requests faster than their token bucket allows
+        if not rate_limit_helper.allow_session(session_id):
+            return JSONResponse(content={"fulfillmentText": RETRY_TEXT})
+
         # Intent handler mapping
         intent_handler_dict = {
             "order.add - context : ongoing-order": add_to_order,
@@ -208,17 +305,30 @@ async def handle_request(request: Request):
 
         # Call the appropriate handler
         handler = intent_handler_dict.get(intent)
-        if handler:
-            return handler(parameters, session_id)
-        else:
+        if not handler:
             return JSONResponse(content={
                 "fulfillmentText": f"Unsupported intent: {intent}"
             })
 
+        # Wait for a free slot, or answer "please retry" when the wait queue is full or the wait takes too long
+        if not await rate_limit_helper.limiter.acquire():
+            return JSONResponse(content={"fulfillmentText": RETRY_TEXT})
+        try:
+            expire_abandoned_carts()
+            return await run_handler(handler, parameters, session_id)
+        finally:
+            rate_limit_helper.limiter.release()
+
     except Exception as e:
+        logger.exception("Error handling webhook request", extra={"intent": intent})
         return JSONResponse(content={
             "fulfillmentText": f"An error occurred: {str(e)}"
         })
+    finally:
+        log_helper.log_success(
+            logger, "Webhook request handled",
+            intent=intent, latency_ms=round((time.perf_counter() - started) * 1000, 3)
+        )
 
 
 def add_to_order(parameters: dict, session_id: str):
@@ -230,6 +340,13 @@ def add_to_order(parameters: dict, session_id: str):
             "fulfillmentText": "Sorry, I didn't understand. Can you specify food items and their quantities clearly?"
         })
 
+    # Check the items against the shared menu snapshot before they reach the database
+    unknown_items = menu_helper.find_unknown_items(food_items)
+    if unknown_items:
+        return JSONResponse(content={
+            "fulfillmentText": f"Sorry, we don't have {', '.join(unknown_items)} on our menu. Can you pick something else?"
+        })
+
     new_food_dict = dict(zip(food_items, quantities))
 
     # Update the session's in-progress order
@@ -237,10 +354,16 @@ def add_to_order(parameters: dict, session_id: str):
         inprogress_orders[session_id].update(new_food_dict)
     else:
         inprogress_orders[session_id] = new_food_dict
+    touch_cart(session_id)
 
     order_str = generic_helper.get_str_from_food_dict(inprogress_orders[session_id])
     fulfillment_text = f"So far you have: {order_str}. Do you need anything else?"
 
+    # Suggest the item most often ordered together with the current cart
+    suggestion = recommend_helper.suggest_for_cart(inprogress_orders[session_id].keys())
+    if suggestion:
+        fulfillment_text += f" Customers often add {suggestion} to an order like this."
+
     return JSONResponse(content={"fulfillmentText": fulfillment_text})
 
 
@@ -252,6 +375,7 @@ def remove_from_order(parameters: dict, session_id: str):
 
     current_order = inprogress_orders[session_id]
     food_items = parameters.get("food-item", [])
+    touch_cart(session_id)
 
     removed_items = []
     no_such_items = []
@@ -284,7 +408,13 @@ def complete_order(parameters: dict, session_id: str):
             "fulfillmentText": "I am having trouble finding your order. Can you place a new order?"
         })
 
+    # A cart emptied with order.remove has nothing to place
     order = inprogress_orders[session_id]
+    if not order:
+        return JSONResponse(content={
+            "fulfillmentText": "Your order is empty. Please add some items before placing it."
+        })
+
     order_id = save_to_db(order)
 
     if order_id == -1:
@@ -294,28 +424,118 @@ def complete_order(parameters: dict, session_id: str):
 
     # Fetch order total and delete the session order
     order_total = db_helper.get_total_order_price(order_id)
-    del inprogress_orders[session_id]
+    forget_cart(session_id)
 
+    recommend_helper.record_order(order_id, order.keys())
+
+    eta = kitchen_helper.eta_minutes(order_id)
     fulfillment_text = (
         f"Awesome! We have placed your order. "
         f"Here is your order ID #{order_id}. "
-        f"Your order total is {order_total}, payable at delivery."
+        f"Your order total is {order_total}, payable at delivery. "
+        f"It should reach you in about {eta} minutes."
     )
     return JSONResponse(content={"fulfillmentText": fulfillment_text})
 
 
+# Items, tracking row and sales rollup are written in one transaction, so
+# reports never scan the orders table and never drift from it
 def save_to_db(order: dict) -> int:
     next_order_id = db_helper.get_next_order_id()
 
-    for food_item, quantity in order.items():
-        result = db_helper.insert_order_item(food_item, quantity, next_order_id)
-        if result == -1:
-            return -1
+    result = db_helper.insert_order(next_order_id, order, "in progress")
+    if result == -1:
+        return -1
 
-    db_helper.insert_order_tracking(next_order_id, "in progress")
+    kitchen_helper.order_opened(next_order_id, order)
     return next_order_id
 
 
+BUSY_RESPONSE = {"error": "Too many reports and exports are running. Please try again in a moment."}
+
+
+@app.get("/reports/sales")
+def sales_report(day: str = "", by: str = "day"):
+    try:
+        sale_date = datetime.date.fromisoformat(day) if day else datetime.date.today()
+    except ValueError:
+        return JSONResponse(status_code=400, content={
+            "error": "Invalid day format. Please use YYYY-MM-DD."
+        })
+
+    if by not in ("day", "hour"):
+        return JSONResponse(status_code=400, content={
+            "error": "Unsupported grouping. Use day or hour."
+        })
+
+    if not rate_limit_helper.report_slots.acquire(blocking=False):
+        return JSONResponse(status_code=503, content=BUSY_RESPONSE)
+    try:
+        report = analytics_helper.get_sales_report(sale_date, by_hour=(by == "hour"))
+    finally:
+        rate_limit_helper.report_slots.release()
+    if report is None:
+        return JSONResponse(status_code=500, content={
+            "error": "Could not load the sales report."
+        })
+
+    return JSONResponse(content=report)
+
+
+class ExportResponse(StreamingResponse):
+    """Streaming response that closes its body when the client goes away.
+
+    Starlette stops iterating on a disconnect but leaves the iterator to the
+    garbage collector, which would keep the export's connection open until then.
+    on_close runs once the body is closed, whether or not it was ever started.
+    """
+
+    def __init__(self, content, on_close=None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                await self.body_iterator.aclose()
+            finally:
+                if self.on_close is not None:
+                    self.on_close()
+
+
+# Iterate a blocking generator in the threadpool and close it once done or abandoned
+async def iterate_and_close(iterator):
+    try:
+        async for chunk in iterate_in_threadpool(iterator):
+            yield chunk
+    finally:
+        await run_in_threadpool(iterator.close)
+
+
+# Stream orders for accounting. Clients resume an interrupted export with
+# after_id set to the last order ID they received completely.
+@app.get("/export/orders")
+def export_orders(format: str = "ndjson", start_id: int = 1, end_id: int = None, after_id: int = None):
+    if format not in ("csv", "ndjson"):
+        return JSONResponse(status_code=400, content={
+            "error": "Unsupported export format. Use csv or ndjson."
+        })
+
+    if not rate_limit_helper.report_slots.acquire(blocking=False):
+        return JSONResponse(status_code=503, content=BUSY_RESPONSE)
+
+    # The slot is held until the stream is finished or abandoned
+    after_order_id = after_id if after_id is not None else max(start_id - 1, 0)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return ExportResponse(
+        iterate_and_close(export_helper.iter_export(format, after_order_id, end_id)),
+        on_close=rate_limit_helper.report_slots.release,
+        media_type=media_type,
+    )
+
+
 def track_order(parameters: dict, session_id: str):
     order_id = parameters.get('order_id') or parameters.get('number')
     if not order_id:
@@ -333,6 +553,9 @@ def track_order(parameters: dict, session_id: str):
     order_status = db_helper.get_order_status(order_id)
     if order_status:
         fulfillment_text = f"The order status for order ID {order_id} is: {order_status}."
+        if order_status == "in progress":
+            eta = kitchen_helper.eta_minutes(order_id)
+            fulfillment_text += f" It should reach you in about {eta} minutes."
     else:
         fulfillment_text = f"No order found with order ID: {order_id}."
 
@@ -0,0 +1,324 @@
+import contextlib
+import fcntl
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+from decimal import Decimal
+
+import db_helper
+import log_helper
+
+# /dev/shm is RAM backed, so every worker maps the same pages
+DEFAULT_SNAPSHOT_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+MENU_SNAPSHOT_PATH = os.getenv("MENU_SNAPSHOT_PATH", os.path.join(DEFAULT_SNAPSHOT_DIR, "pandeyji_menu.snapshot"))
+
+# File layout: header, item records sorted by name key, then record numbers sorted by item_id
+MAGIC = b"MENU"
+LAYOUT_VERSION = 2
+HEADER = struct.Struct("<4sHHQI4x")  # magic, layout version, reserved, generation, item count
+RECORD = struct.Struct("<iqi64s64s")  # item_id, price in cents, prep minutes, casefolded name key, display name
+ID_INDEX = struct.Struct("<i")
+NAME_BYTES = 64
+KEY_OFFSET = 16
+
+logger = log_helper.get_logger("menu")
+
+
+def name_key(name: str):
+    return name.strip().casefold().encode("utf-8")
+
+
+class MenuSnapshot:
+    """Read-only view of a published menu snapshot, mapped straight from the file."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.file_id = (stat.st_dev, stat.st_ino)
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, layout_version, _, self.generation, self.count = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or layout_version != LAYOUT_VERSION:
+            self.buffer.close()
+            raise ValueError(f"Unsupported menu snapshot format in {path}")
+        self.id_index_offset = HEADER.size + self.count * RECORD.size
+
+    def close(self):
+        self.buffer.close()
+
+    # Records as publish builds them: (name key, item_id, price in cents, prep minutes, display name)
+    def raw_records(self):
+        records = []
+        for position in range(self.count):
+            item_id, price_cents, prep_minutes, key, name = RECORD.unpack_from(
+                self.buffer, HEADER.size + position * RECORD.size
+            )
+            records.append((key.rstrip(b"\0"), item_id, price_cents, prep_minutes, name.rstrip(b"\0")))
+        return records
+
+    def record(self, position: int):
+        item_id, price_cents, prep_minutes, _, name = RECORD.unpack_from(
+            self.buffer, HEADER.size + position * RECORD.size
+        )
+        return item_id, name.rstrip(b"\0").decode("utf-8"), Decimal(price_cents) / 100, prep_minutes
+
+    def key_at(self, position: int):
+        offset = HEADER.size + position * RECORD.size + KEY_OFFSET
+        return self.buffer[offset:offset + NAME_BYTES].rstrip(b"\0")
+
+    def item_id_at(self, id_position: int):
+        record_position = ID_INDEX.unpack_from(self.buffer, self.id_index_offset + id_position * ID_INDEX.size)[0]
+        return RECORD.unpack_from(self.buffer, HEADER.size + record_position * RECORD.size)[0], record_position
+
+    # Binary search over the name keys
+    def find_by_name(self, name: str):
+        key = name_key(name)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self.key_at(low) == key:
+            return self.record(low)
+        return None
+
+    # Binary search over the item_id index
+    def find_by_id(self, item_id: int):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.item_id_at(middle)[0] < item_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count:
+            found_id, record_position = self.item_id_at(low)
+            if found_id == item_id:
+                return self.record(record_position)
+        return None
+
+
+# Generation of the published snapshot. The header is the same in every layout version,
+# so a snapshot in an older layout still counts and generations keep going up.
+def read_generation(path: str):
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+        if len(header) == HEADER.size:
+            magic, _, _, generation, _ = HEADER.unpack(header)
+            if magic == MAGIC:
+                return generation
+    except OSError:
+        pass
+    return 0
+
+
+# Snapshot records for (item_id, name, price, prep_minutes) rows, sorted by name key
+def build_records(items):
+    records = []
+    for item_id, name, price, prep_minutes in items:
+        key = name_key(name)
+        display_name = name.encode("utf-8")
+        if len(key) > NAME_BYTES or len(display_name) > NAME_BYTES:
+            logger.warning("Skipping menu item with a name that is too long", extra={"item_id": item_id})
+            continue
+        price_cents = int((Decimal(price) * 100).to_integral_value())
+        records.append((key, item_id, price_cents, int(prep_minutes), display_name))
+    records.sort()
+    return records
+
+
+# Every publish holds an exclusive lock on the lock file, so workers publish one at a time
+# and each one reads the generation it increments only while holding the lock
+@contextlib.contextmanager
+def publish_lock(path: str = MENU_SNAPSHOT_PATH):
+    with open(path + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+# Records of the snapshot published at path, or None if there is none
+def read_records(path: str):
+    try:
+        snapshot = MenuSnapshot(path)
+    except (OSError, ValueError):
+        return None
+    try:
+        return snapshot.raw_records()
+    finally:
+        snapshot.close()
+
+
+# Write a new snapshot next to the old one and swap it in with a single rename.
+# Workers that still have the old generation mapped keep reading it until they re-attach.
+# The caller holds publish_lock.
+def write_snapshot(records, path: str):
+    id_order = sorted(range(len(records)), key=lambda position: records[position][1])
+    generation = read_generation(path) + 1
+
+    data = bytearray(HEADER.pack(MAGIC, LAYOUT_VERSION, 0, generation, len(records)))
+    for key, item_id, price_cents, prep_minutes, display_name in records:
+        data += RECORD.pack(item_id, price_cents, prep_minutes, key, display_name)
+    for position in id_order:
+        data += ID_INDEX.pack(position)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".menu-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return generation
+
+
+def publish(items, path: str = MENU_SNAPSHOT_PATH):
+    records = build_records(items)
+    with publish_lock(path):
+        return write_snapshot(records, path)
+
+
+# Load the menu from the database and publish it
+def publish_from_db(path: str = MENU_SNAPSHOT_PATH):
+    items = db_helper.get_food_items()
+    if items is None:
+        return -1
+    return publish(items, path)
+
+
+# Publish a new snapshot only if the menu in the database differs from the published one.
+# Every worker runs this on startup, so a menu changed while the app was down is picked up;
+# the comparison is made under the lock, so only the first of them writes a new generation.
+def refresh_from_db(path: str = MENU_SNAPSHOT_PATH):
+    items = db_helper.get_food_items()
+    if items is None:
+        return -1
+    records = build_records(items)
+    with publish_lock(path):
+        if read_records(path) == records:
+            return read_generation(path)
+        logger.info("Menu changed in the database, publishing a new snapshot")
+        return write_snapshot(records, path)
+
+
+def refresh_quietly():
+    try:
+        refresh_from_db()
+    except Exception as e:
+        logger.error("Error refreshing menu snapshot", extra={"error": str(e)})
+
+
+_refresh_thread = None
+_refresh_thread_lock = threading.Lock()
+
+
+# Refresh the snapshot on a background thread, so a request that found it stale never waits
+# for the publish; requests made while a refresh is running do not start another one
+def refresh_in_background():
+    global _refresh_thread
+    with _refresh_thread_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return
+        _refresh_thread = threading.Thread(target=refresh_quietly, name="menu-refresh", daemon=True)
+        _refresh_thread.start()
+
+
+# Publish the first snapshot if none exists. Only one worker loads the menu;
+# the others wait for the lock and find the snapshot it published.
+def ensure_published(path: str = MENU_SNAPSHOT_PATH):
+    if os.path.exists(path):
+        return
+    with publish_lock(path):
+        if os.path.exists(path):
+            return
+        items = db_helper.get_food_items()
+        if items is not None:
+            write_snapshot(build_records(items), path)
+
+
+_snapshot = None
+
+
+# The attached snapshot of this process, re-attached whenever a new generation has been swapped in
+def get_snapshot():
+    global _snapshot
+    try:
+        stat = os.stat(MENU_SNAPSHOT_PATH)
+    except FileNotFoundError:
+        ensure_published()
+        try:
+            stat = os.stat(MENU_SNAPSHOT_PATH)
+        except FileNotFoundError:
+            return None
+
+    if _snapshot is None or _snapshot.file_id != (stat.st_dev, stat.st_ino):
+        try:
+            snapshot = MenuSnapshot(MENU_SNAPSHOT_PATH)
+        except (OSError, ValueError) as e:
+            logger.error("Error attaching menu snapshot", extra={"error": str(e)})
+            return _snapshot
+        if _snapshot is not None:
+            _snapshot.close()
+        _snapshot = snapshot
+    return _snapshot
+
+
+# Look up (item_id, name, price, prep_minutes) for a food item name; None if unknown or no snapshot
+def get_item(name: str):
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return None
+    return snapshot.find_by_name(name)
+
+
+# Names that are not on the menu. Without a snapshot nothing can be checked, so nothing is reported.
+# The database has the final say on names the snapshot does not know; if it has any of them,
+# the snapshot is stale and a new one is published in the background.
+def find_unknown_items(names):
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return []
+    missing = [name for name in names if snapshot.find_by_name(name) is None]
+    if not missing:
+        return []
+
+    found = db_helper.get_food_item_names(missing)
+    if found is None:
+        return []
+    found_keys = {name_key(name) for name in found}
+    if found_keys:
+        refresh_in_background()
+    return [name for name in missing if name_key(name) not in found_keys]
+
+
+if __name__ == "__main__":
+
+    # Publish a new generation after the menu changed: python menu_helper.py publish
+    if len(sys.argv) > 1 and sys.argv[1] == "publish":
+        generation = publish_from_db()
+        if generation == -1:
+            sys.exit(1)
+        print(f"Published menu snapshot generation {generation} to {MENU_SNAPSHOT_PATH}")
+    else:
+        snapshot = get_snapshot()
+        if snapshot is None:
+            print("No menu snapshot published.")
+        else:
+            print(f"Menu snapshot generation {snapshot.generation} with {snapshot.count} items:")
+            for position in range(snapshot.count):
+                item_id, name, price, prep_minutes = snapshot.record(position)
+                print(f"  {item_id}: {name} {price} ({prep_minutes} min)")
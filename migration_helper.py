@@ -0,0 +1,157 @@
+import os
+import re
+import sys
+
+import mysql.connector
+
+import db_helper
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "db", "migrations")
+MIGRATION_FILE_PATTERN = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+
+# Find migration files, sorted by version number
+def list_migrations():
+    migrations = []
+    for file_name in os.listdir(MIGRATIONS_DIR):
+        match = MIGRATION_FILE_PATTERN.match(file_name)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, file_name)))
+    return sorted(migrations)
+
+
+# Split a migration file into statements, dropping "--" comment lines
+def read_statements(path):
+    with open(path) as f:
+        lines = [line for line in f if not line.lstrip().startswith("--")]
+    return [statement.strip() for statement in "".join(lines).split(";") if statement.strip()]
+
+
+def ensure_migrations_table(cnx):
+    cursor = cnx.cursor()
+    try:
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "  version int NOT NULL,"
+            "  name varchar(255) NOT NULL,"
+            "  applied_at datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,"
+            "  PRIMARY KEY (version)"
+            ")"
+        )
+    finally:
+        cursor.close()
+
+
+def get_applied_versions(cnx):
+    cursor = cnx.cursor()
+    try:
+        cursor.execute("SELECT version FROM schema_migrations")
+        return {row[0] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+# Apply every migration that has not been applied yet, in version order.
+# MySQL commits DDL implicitly, so a failed migration is reported and the run stops there.
+def migrate_up(cnx):
+    ensure_migrations_table(cnx)
+    applied = get_applied_versions(cnx)
+
+    for version, name, path in list_migrations():
+        if version in applied:
+            continue
+
+        cursor = cnx.cursor()
+        try:
+            for statement in read_statements(path):
+                cursor.execute(statement)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name)
+            )
+            cnx.commit()
+            print(f"Applied migration {version:04d}_{name}")
+        except mysql.connector.Error as err:
+            print(f"Error applying migration {version:04d}_{name}: {err}")
+            cnx.rollback()
+            return False
+        finally:
+            cursor.close()
+
+    return True
+
+
+def print_status(cnx):
+    ensure_migrations_table(cnx)
+    applied = get_applied_versions(cnx)
+    for version, name, _ in list_migrations():
+        state = "applied" if version in applied else "pending"
+        print(f"{version:04d}_{name}: {state}")
+
+
+# Move delivered orders into the archive tables in batches.
+# The newest order is never archived, so get_next_order_id keeps working off MAX(order_id).
+# Sales rollups are not touched; exports and the rollup backfill read both tables.
+def archive_delivered_orders(cnx, batch_size=1000):
+    archived = 0
+    cursor = cnx.cursor()
+    try:
+        while True:
+            cursor.execute(
+                "SELECT t.order_id FROM order_tracking t "
+                "WHERE t.status = 'delivered' "
+                "AND t.order_id < (SELECT MAX(order_id) FROM orders) "
+                "ORDER BY t.order_id LIMIT %s",
+                (batch_size,)
+            )
+            order_ids = [row[0] for row in cursor.fetchall()]
+            if not order_ids:
+                break
+
+            placeholders = ", ".join(["%s"] * len(order_ids))
+            cursor.execute(
+                "INSERT INTO orders_archive (order_id, item_id, quantity, total_price, created_at) "
+                f"SELECT order_id, item_id, quantity, total_price, created_at FROM orders WHERE order_id IN ({placeholders})",
+                order_ids
+            )
+            cursor.execute(
+                "INSERT INTO order_tracking_archive (order_id, status) "
+                f"SELECT order_id, status FROM order_tracking WHERE order_id IN ({placeholders})",
+                order_ids
+            )
+            cursor.execute(f"DELETE FROM orders WHERE order_id IN ({placeholders})", order_ids)
+            cursor.execute(f"DELETE FROM order_tracking WHERE order_id IN ({placeholders})", order_ids)
+            cnx.commit()
+            archived += len(order_ids)
+    except mysql.connector.Error as err:
+        print(f"Error archiving delivered orders: {err}")
+        cnx.rollback()
+        return -1
+    finally:
+        cursor.close()
+
+    return archived
+
+
+if __name__ == "__main__":
+
+    # Usage: python migration_helper.py [status | up | archive [batch_size]]
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+
+    cnx = db_helper.connect()
+    try:
+        if command == "up":
+            if not migrate_up(cnx):
+                sys.exit(1)
+        elif command == "archive":
+            batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+            archived = archive_delivered_orders(cnx, batch_size)
+            if archived == -1:
+                sys.exit(1)
+            print(f"Archived {archived} delivered orders.")
+        elif command == "status":
+            print_status(cnx)
+        else:
+            print("Usage: python migration_helper.py [status | up | archive [batch_size]]")
+            sys.exit(1)
+    finally:
+        cnx.close()
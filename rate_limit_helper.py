@@ -0,0 +1,124 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Token bucket settings per session (requests per second and burst size)
+SESSION_RATE = float(os.getenv("SESSION_RATE", 5))
+SESSION_BURST = float(os.getenv("SESSION_BURST", 10))
+
+# Global concurrency settings (requests being handled and requests allowed to wait).
+# Handlers share db_helper.cnx and the in-memory carts, so they run one at a time.
+MAX_CONCURRENT_REQUESTS = 1
+MAX_QUEUED_REQUESTS = int(os.getenv("MAX_QUEUED_REQUESTS", 32))
+
+# Longest a request waits for a slot before it is answered with "please retry",
+# kept well below Dialogflow's 5 second webhook timeout
+MAX_QUEUE_WAIT_SECONDS = float(os.getenv("MAX_QUEUE_WAIT_SECONDS", 2))
+
+# Sales reports and exports open their own database connections (an export holds two until it
+# is done), so only this many run at once and the rest are turned away
+MAX_REPORT_REQUESTS = int(os.getenv("MAX_REPORT_REQUESTS", 2))
+
+# Buckets idle for this long are full again, so they can be dropped
+IDLE_BUCKET_SECONDS = SESSION_BURST / SESSION_RATE if SESSION_RATE > 0 else 60.0
+
+# Hard limit on tracked sessions; past it the least recently seen bucket is dropped
+MAX_BUCKETS = int(os.getenv("MAX_BUCKETS", 10000))
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, now: float):
+        self.tokens = SESSION_BURST
+        self.updated_at = now
+
+    def take(self, now: float) -> bool:
+        elapsed = now - self.updated_at
+        self.tokens = min(SESSION_BURST, self.tokens + elapsed * SESSION_RATE)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+# Session ID -> token bucket, least recently seen first
+session_buckets = OrderedDict()
+
+
+# Drop buckets from the front that are idle long enough to be full again,
+# and the least recently seen ones while there are too many
+def prune_buckets(now: float):
+    while session_buckets:
+        bucket = next(iter(session_buckets.values()))
+        if len(session_buckets) < MAX_BUCKETS and now - bucket.updated_at <= IDLE_BUCKET_SECONDS:
+            break
+        session_buckets.popitem(last=False)
+
+
+# Check whether a session is allowed to make another request right now.
+# Requests without a session ID are only subject to the global limiter.
+def allow_session(session_id: str) -> bool:
+    if not session_id:
+        return True
+    now = time.monotonic()
+    bucket = session_buckets.get(session_id)
+    if bucket is None:
+        prune_buckets(now)
+        bucket = session_buckets[session_id] = TokenBucket(now)
+    else:
+        session_buckets.move_to_end(session_id)
+    return bucket.take(now)
+
+
+class ConcurrencyLimiter:
+    def __init__(self, max_concurrent: int, max_queued: int, max_wait: float):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiters = deque()
+
+    # Returns False straight away when the wait queue is already full,
+    # and after max_wait seconds when no slot came free in time
+    async def acquire(self) -> bool:
+        if self.active < self.max_concurrent and not self.waiters:
+            self.active += 1
+            return True
+        if len(self.waiters) >= self.max_queued:
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.max_wait)
+        except asyncio.TimeoutError:
+            self.abandon(waiter)
+            return False
+        except BaseException:
+            self.abandon(waiter)
+            raise
+        return True
+
+    def abandon(self, waiter):
+        if waiter in self.waiters:
+            self.waiters.remove(waiter)
+        elif waiter.done() and not waiter.cancelled():
+            # The slot was handed over to us just before we gave up
+            self.release()
+
+    # Hand the slot to the oldest waiter, or free it
+    def release(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+limiter = ConcurrencyLimiter(MAX_CONCURRENT_REQUESTS, MAX_QUEUED_REQUESTS, MAX_QUEUE_WAIT_SECONDS)
+report_slots = threading.BoundedSemaphore(MAX_REPORT_REQUESTS)
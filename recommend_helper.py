@@ -0,0 +1,186 @@
+import contextlib
+import threading
+from array import array
+
+import db_helper
+import log_helper
+import menu_helper
+
+logger = log_helper.get_logger("recommend")
+
+
+class CoOccurrenceIndex:
+    """Counts how often two items were bought in the same order.
+
+    Counts live in one flat n x n array of unsigned ints, with a row per item_id.
+    Adding an order touches only the pairs in that order.
+    """
+
+    def __init__(self):
+        self.positions = {}
+        self.item_ids = []
+        self.counts = array("I")
+
+    def position_of(self, item_id: int):
+        position = self.positions.get(item_id)
+        if position is None:
+            position = self.grow(item_id)
+        return position
+
+    # Make room for a new item by copying the matrix into one with an extra row and column
+    def grow(self, item_id: int):
+        size = len(self.item_ids)
+        new_size = size + 1
+        counts = array("I", bytes(new_size * new_size * self.counts.itemsize))
+        for row in range(size):
+            counts[row * new_size:row * new_size + size] = self.counts[row * size:(row + 1) * size]
+        self.counts = counts
+        self.positions[item_id] = size
+        self.item_ids.append(item_id)
+        return size
+
+    def add_order(self, item_ids):
+        positions = [self.position_of(item_id) for item_id in set(item_ids)]
+        size = len(self.item_ids)
+        for row in positions:
+            base = row * size
+            for column in positions:
+                if column != row:
+                    self.counts[base + column] += 1
+
+    # The item most often bought with the cart that is not already in it, or None
+    def suggest(self, cart_item_ids):
+        size = len(self.item_ids)
+        rows = [self.positions[item_id] for item_id in cart_item_ids if item_id in self.positions]
+        if not rows:
+            return None
+
+        if len(rows) == 1:
+            scores = self.counts[rows[0] * size:(rows[0] + 1) * size]
+        else:
+            scores = [sum(column) for column in zip(*(self.counts[row * size:(row + 1) * size] for row in rows))]
+
+        for row in rows:
+            scores[row] = 0
+        best_score = max(scores)
+        if best_score == 0:
+            return None
+        return self.item_ids[scores.index(best_score)]
+
+
+# None until the background load has finished; no suggestions are made before that
+index = None
+
+# (order_id, item_ids) of orders completed while the index is loading, replayed onto it afterwards
+_orders_during_load = None
+_load_lock = threading.Lock()
+
+_loader_thread = None
+_stop_loading = threading.Event()
+
+
+# Build an index from the live and archived orders in the database, one chunk at a time.
+# Returns the index and the highest order_id in it, or None if loading was stopped.
+def load_from_db():
+    new_index = CoOccurrenceIndex()
+    current_order_id = None
+    current_items = []
+    with contextlib.closing(db_helper.stream_orders()) as chunks:
+        for rows in chunks:
+            if _stop_loading.is_set():
+                return None
+            for row in rows:
+                order_id, item_id = row[0], row[1]
+                if order_id != current_order_id:
+                    if current_items:
+                        new_index.add_order(current_items)
+                    current_order_id = order_id
+                    current_items = []
+                current_items.append(item_id)
+    if current_items:
+        new_index.add_order(current_items)
+    return new_index, current_order_id or 0
+
+
+# Swap in the loaded index, adding the orders completed since the load started
+def finish_loading(new_index, loaded_up_to: int):
+    global index, _orders_during_load
+    with _load_lock:
+        for order_id, item_ids in _orders_during_load or []:
+            if order_id > loaded_up_to:
+                new_index.add_order(item_ids)
+        _orders_during_load = None
+        index = new_index
+
+
+def load_in_background():
+    try:
+        loaded = load_from_db()
+    except Exception as e:
+        # Start from the orders completed since startup rather than never suggesting anything
+        logger.error("Error loading recommendations", extra={"error": str(e)})
+        loaded = CoOccurrenceIndex(), 0
+    if loaded is None:
+        return
+    new_index, loaded_up_to = loaded
+    finish_loading(new_index, loaded_up_to)
+    logger.info("Recommendations loaded", extra={"items": len(new_index.item_ids)})
+
+
+# Load the index on a background thread, so a worker starts serving without waiting for it
+def start_loading():
+    global _orders_during_load, _loader_thread
+    with _load_lock:
+        _orders_during_load = []
+    _stop_loading.clear()
+    _loader_thread = threading.Thread(target=load_in_background, name="recommend-loader", daemon=True)
+    _loader_thread.start()
+
+
+# Wait for a background load to finish, for tools that need the full index before they start
+def wait_for_load(timeout: float = None):
+    if _loader_thread is not None:
+        _loader_thread.join(timeout)
+
+
+# Stop a load that is still running; it gives up at the next chunk and closes its connections
+def stop_loading(timeout: float = 10):
+    _stop_loading.set()
+    if _loader_thread is not None:
+        _loader_thread.join(timeout)
+
+
+def item_ids_for(food_names):
+    snapshot = menu_helper.get_snapshot()
+    if snapshot is None:
+        return []
+    item_ids = []
+    for name in food_names:
+        item = snapshot.find_by_name(name)
+        if item is not None:
+            item_ids.append(item[0])
+    return item_ids
+
+
+# Record the items of a completed order
+def record_order(order_id: int, food_names):
+    item_ids = item_ids_for(food_names)
+    if not item_ids:
+        return
+    with _load_lock:
+        if _orders_during_load is not None:
+            _orders_during_load.append((order_id, item_ids))
+        elif index is not None:
+            index.add_order(item_ids)
+
+
+# Name of the item most often ordered together with the cart, or None
+def suggest_for_cart(food_names):
+    current_index = index
+    if current_index is None:
+        return None
+    suggested_id = current_index.suggest(item_ids_for(food_names))
+    if suggested_id is None:
+        return None
+    item = menu_helper.get_snapshot().find_by_id(suggested_id)
+    return item[1] if item is not None else None